@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the per window aggregation config variables
+"""
+
+AGGREGATION_ENABLED = False
+
+# length of an aggregation window in seconds, should match the netdata
+# statsd update_every so every chart point gets one window
+AGGREGATION_WINDOW = 10.0
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the streaming anomaly detection config variables
+"""
+
+ANOMALY_DETECTION_ENABLED = False
+
+# smoothing factor of the exponentially weighted mean and variance, higher
+# values adapt faster but forget the baseline sooner
+ANOMALY_EWMA_ALPHA = 0.1
+
+# a sample is flagged once it is this many standard deviations away from
+# the smoothed mean
+ANOMALY_Z_THRESHOLD = 4.0
+
+# number of samples used to build the baseline before anything is flagged
+ANOMALY_WARMUP_SAMPLES = 10
+
+# standard deviation floor, keeps the score finite on flat series
+ANOMALY_MIN_STD = 1e-3
+
+# metrics to watch and how to look at them: "level" scores the value as
+# received, "delta" scores the change between two samples (for the
+# cumulative counters mosquitto publishes)
+ANOMALY_METRICS = {
+    "mosquito_monitor.publish_dropped": "delta",
+    "mosquito_monitor.inflight": "level",
+    "mosquito_monitor.heap_current": "level",
+}
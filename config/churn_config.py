@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the client churn tracking config variables
+"""
+
+CHURN_TRACKING_ENABLED = False
+
+# topic the broker publishes its log to (log_dest topic in mosquitto.conf)
+CHURN_LOG_TOPIC = "$SYS/broker/log/#"
+
+# seconds over which connects are counted before the report
+CHURN_WINDOW = 60.0
+
+# number of client ids tracked by the heavy hitter counters
+CHURN_TRACKED_CLIENTS = 64
+
+# a client connecting this many times in one window is reported as being in
+# a reconnect loop
+CHURN_RECONNECT_THRESHOLD = 10
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the flight recorder config variables
+"""
+
+# keep the last $SYS messages in memory instead of logging every one of them
+FLIGHT_RECORDER_ENABLED = True
+
+# number of messages kept
+FLIGHT_RECORDER_SIZE = 4096
+
+# payload bytes kept per message, longer payloads are truncated
+FLIGHT_RECORDER_PAYLOAD_SIZE = 64
+
+# directory the dumps are written to
+FLIGHT_RECORDER_DUMP_DIR = "/home/as/"
+
+# minimum seconds between two dumps triggered by a failing handler, so a
+# broken topic does not turn into a dump per message
+FLIGHT_RECORDER_DUMP_INTERVAL = 60.0
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the capacity forecasting config variables
+"""
+
+FORECAST_ENABLED = False
+
+# seconds of samples averaged into one point of the trend
+FORECAST_BUCKET = 60.0
+
+# number of points the trend is fitted on, the window covers
+# FORECAST_BUCKET * FORECAST_WINDOW seconds
+FORECAST_WINDOW = 60
+
+# points needed before a forecast is sent
+FORECAST_MIN_POINTS = 5
+
+# longest time to exhaustion sent, also sent when the metric is not
+# growing
+FORECAST_HORIZON = 30 * 24 * 60 * 60.0
+
+# metrics to forecast and the limit they run into, either a number or the
+# name of the metric holding the limit. The $SYS heap/maximum and
+# clients/maximum are the peaks seen by the broker, not its limits, so the
+# defaults are the broker config values (memory_limit, max_connections)
+FORECAST_METRICS = {
+    "mosquito_monitor.heap_current": 1024 * 1024 * 1024,
+    "mosquito_monitor.clients_connected": 10000,
+    "mosquito_monitor.inflight": 10000,
+}
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the active/standby leader election config variables
+"""
+
+# elect one leader among the monitors of a broker, only the leader sends
+# metrics, the others keep their state warm and take over when it goes away
+HA_ENABLED = False
+
+# retained topic holding the lease, shared by all the monitors of a broker
+HA_LEASE_TOPIC = "mosquito_monitor/lease"
+
+# seconds a lease is valid without heartbeat, a standby takes over at most
+# HA_LEASE_TTL + HA_HEARTBEAT seconds after the leader went away
+HA_LEASE_TTL = 10.0
+
+# seconds between two lease heartbeats of the leader
+HA_HEARTBEAT = 2.0
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the watchdog and health endpoint config variables
+"""
+
+WATCHDOG_ENABLED = False
+
+# seconds between two loop probes
+WATCHDOG_INTERVAL = 1.0
+
+# loop lag (or time spent in a single handler) after which the collector is
+# considered stalled
+WATCHDOG_STALL_TIMEOUT = 30.0
+
+# exit the process on stall so the supervisor restarts it
+WATCHDOG_EXIT_ON_STALL = False
+
+# the collector is not ready when no $SYS message came for this long
+WATCHDOG_STALE_AFTER = 60.0
+
+HEALTH_ADDRESS = "127.0.0.1"
+
+HEALTH_PORT = 8126
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the broker load generator default variables
+"""
+
+LOADGEN_PUBLISHERS = 10
+
+LOADGEN_SUBSCRIBERS = 2
+
+# total publish rate of all publishers, in messages per second
+LOADGEN_RATE = 1000.0
+
+# number of distinct topics the publishes are spread over
+LOADGEN_TOPICS = 100
+
+LOADGEN_PAYLOAD_SIZE = 64
+
+LOADGEN_QOS = 0
+
+# run time in seconds
+LOADGEN_DURATION = 60.0
+
+LOADGEN_TOPIC_PREFIX = "loadgen"
+
+# seconds between two progress reports
+LOADGEN_REPORT_INTERVAL = 1.0
+
+# spool of the progress reports over statsd tcp, the monitor running
+# alongside owns SPOOL_PATH
+LOADGEN_SPOOL_PATH = "/home/as/mosquito_monitor-loadgen.spool"
+LOADGEN_SPOOL_SIZE = 1024 * 1024
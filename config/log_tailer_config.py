@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the mosquitto log tailer config variables
+"""
+
+LOG_TAILER_ENABLED = False
+
+MOSQUITTO_LOG_PATH = "/var/log/mosquitto/mosquitto.log"
+
+# seconds between two event rate updates, also the longest time the tailer
+# sleeps when no file change is notified
+LOG_TAILER_INTERVAL = 1.0
+
+# maximum bytes read from the log in one go
+LOG_TAILER_READ_SIZE = 64 * 1024
@@ -72,6 +72,66 @@ def get_logging_conf() -> dict:
                     "level": "DEBUG",
                     "propagate": "no",
                     "handlers": ["json", "console"]
+                },
+                "local_mqtt_client.metric_sink": {
+                    "level": "DEBUG",
+                    "propagate": "no",
+                    "handlers": ["json", "console"]
+                },
+                "local_mqtt_client.watchdog": {
+                    "level": "DEBUG",
+                    "propagate": "no",
+                    "handlers": ["json", "console"]
+                },
+                "local_mqtt_client.log_tailer": {
+                    "level": "DEBUG",
+                    "propagate": "no",
+                    "handlers": ["json", "console"]
+                },
+                "local_mqtt_client.load_generator": {
+                    "level": "DEBUG",
+                    "propagate": "no",
+                    "handlers": ["json", "console"]
+                },
+                "local_mqtt_client.flush_scheduler": {
+                    "level": "DEBUG",
+                    "propagate": "no",
+                    "handlers": ["json", "console"]
+                },
+                "local_mqtt_client.flight_recorder": {
+                    "level": "DEBUG",
+                    "propagate": "no",
+                    "handlers": ["json", "console"]
+                },
+                "local_mqtt_client.profiler": {
+                    "level": "DEBUG",
+                    "propagate": "no",
+                    "handlers": ["json", "console"]
+                },
+                "local_mqtt_client.message_queue": {
+                    "level": "DEBUG",
+                    "propagate": "no",
+                    "handlers": ["json", "console"]
+                },
+                "local_mqtt_client.retained_scanner": {
+                    "level": "DEBUG",
+                    "propagate": "no",
+                    "handlers": ["json", "console"]
+                },
+                "local_mqtt_client.leader_election": {
+                    "level": "DEBUG",
+                    "propagate": "no",
+                    "handlers": ["json", "console"]
+                },
+                "local_mqtt_client.process_monitor": {
+                    "level": "DEBUG",
+                    "propagate": "no",
+                    "handlers": ["json", "console"]
+                },
+                "local_mqtt_client.metric_spool": {
+                    "level": "DEBUG",
+                    "propagate": "no",
+                    "handlers": ["json", "console"]
                 }
             }
         }
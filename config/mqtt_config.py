@@ -6,3 +6,46 @@ This file contains most of the bridge config variables
 LOCAL_MQTT_PORT = 1885
 
 LOCAL_MQTT_ADDRESS = "127.0.0.1"
+
+LOCAL_MQTT_KEEPALIVE = 60
+
+# tls towards the broker, LOCAL_MQTT_PORT must then point at a tls listener
+LOCAL_MQTT_TLS_ENABLED = False
+
+# ca bundle used to verify the broker, None uses the system store
+LOCAL_MQTT_CA_CERTS = None
+
+# client certificate and key, for brokers requiring them
+LOCAL_MQTT_CERTFILE = None
+
+LOCAL_MQTT_KEYFILE = None
+
+# openssl cipher string, None keeps the python defaults
+LOCAL_MQTT_CIPHERS = None
+
+# skip the broker hostname check (self signed test certificates)
+LOCAL_MQTT_TLS_INSECURE = False
+
+# connect with MQTT v5 when the broker and paho-mqtt (1.5+) support it, the
+# client falls back to 3.1.1 otherwise
+LOCAL_MQTT_V5_ENABLED = False
+
+# seconds the v5 probe connection waits for the broker to accept it
+LOCAL_MQTT_V5_PROBE_TIMEOUT = 5.0
+
+# v5 probes made on startup while the broker can not be reached, and the
+# seconds between two of them. The client then starts with 3.1.1 and
+# probes again once it is connected
+LOCAL_MQTT_V5_PROBE_ATTEMPTS = 3
+
+LOCAL_MQTT_V5_PROBE_RETRY = 2.0
+
+# topic aliases the broker may set towards the client, above the number of
+# $SYS metrics every metric topic can get one
+LOCAL_MQTT_TOPIC_ALIAS_MAXIMUM = 64
+
+# qos 1 and 2 messages the broker may have in flight towards the client
+LOCAL_MQTT_RECEIVE_MAXIMUM = 32
+
+# seconds between two reports of the received bytes per message
+LOCAL_MQTT_REPORT_INTERVAL = 10.0
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the broker process monitor config variables
+"""
+
+PROCESS_MONITOR_ENABLED = False
+
+# name of the broker process as found in /proc/<pid>/comm
+BROKER_PROCESS_NAME = "mosquitto"
+
+# pid file written by the broker (pid_file in mosquitto.conf), tried before
+# scanning /proc
+BROKER_PID_FILE = "/run/mosquitto/mosquitto.pid"
+
+# minimum seconds between two samples of the process
+PROCESS_INTERVAL = 10.0
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the on demand profiling config variables
+"""
+
+# time the message handlers and profile the collector on SIGUSR2 or on the
+# health endpoint /profile
+PROFILING_ENABLED = True
+
+# seconds a profiling session runs
+PROFILE_DURATION = 10.0
+
+# seconds between two stack samples of the network loop thread
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+# directory the profiling reports are written to
+PROFILE_DUMP_DIR = "/home/as/"
+
+# number of lines kept in every section of the report
+PROFILE_TOP = 30
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the receive queue config variables
+"""
+
+# hand the $SYS metric messages from the network loop to a worker thread
+# through a bounded queue instead of handling them in the paho callback
+QUEUE_ENABLED = False
+
+# number of messages the queue holds
+QUEUE_SIZE = 10000
+
+# what happens when the worker falls behind: "drop_oldest" drops the oldest
+# message of a full queue, "coalesce" keeps only the latest message of
+# every topic so the queue never holds more than one value per metric
+QUEUE_POLICY = "coalesce"
+
+# seconds between two reports of the queue metrics
+QUEUE_REPORT_INTERVAL = 10.0
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the mqtt republishing config variables
+"""
+
+# publish the latest value of every metric sent to statsd back to the
+# broker as one document, for the consumers without statsd
+REPUBLISH_ENABLED = False
+
+# retained topic the document is published to
+REPUBLISH_TOPIC = "mosquitto_monitor/state"
+
+# seconds between two documents
+REPUBLISH_INTERVAL = 10.0
+
+# "json", "msgpack" (needs the msgpack package) or "cbor" (needs cbor2)
+REPUBLISH_FORMAT = "json"
+
+REPUBLISH_QOS = 0
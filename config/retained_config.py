@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the retained message scanner config variables
+"""
+
+RETAINED_SCAN_ENABLED = False
+
+# wildcard subscribed to by the scan, only the retained messages matching
+# it are counted
+RETAINED_SCAN_TOPIC = "#"
+
+# seconds between two scans
+RETAINED_SCAN_INTERVAL = 3600.0
+
+# the broker count of retained messages, $SYS included, compared with the
+# number scanned to tell a complete scan from a truncated one when the scan
+# topic is "#"
+RETAINED_COUNT_TOPIC = "$SYS/broker/retained messages/count"
+
+# retained messages read per second, the scan subscribes with qos 1 so the
+# broker never has more than its inflight window outstanding
+RETAINED_SCAN_RATE = 1000.0
+
+# the scan ends when no retained message came for this many seconds
+RETAINED_SCAN_QUIET = 2.0
+
+# the scan is cut after this many seconds
+RETAINED_SCAN_TIMEOUT = 300.0
+
+# number of largest topics reported, their sizes are sent as
+# retained.top.<rank> and their topics logged
+RETAINED_TOP_TOPICS = 10
+
+# number of top level topic prefixes with their own byte total, the rest
+# is added up as _other
+RETAINED_MAX_PREFIXES = 32
+
+# upper bounds in bytes of the payload size histogram buckets
+RETAINED_SIZE_BUCKETS = (
+    64, 256, 1024, 4096, 16384, 65536, 262144, 1048576
+)
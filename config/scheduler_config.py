@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the flush scheduler config variables
+"""
+
+FLUSH_SCHEDULER_ENABLED = False
+
+# seconds between two flushes, should match the netdata statsd update_every
+FLUSH_INTERVAL = 1.0
+
+# where in the interval the flush happens, as a fraction of the interval
+# after the wall clock boundary; half way keeps the flush away from the
+# netdata collection tick on the boundary
+FLUSH_PHASE = 0.5
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the $SYS schema profile config variables
+"""
+
+# subscribe only to the $SYS topics published by the version of the broker
+# read from $SYS/broker/version, instead of to $SYS/#. Off by default, the
+# version table in local_mqtt_client/sys_schema.py only tells the brokers
+# before 1.5 apart yet, and the metrics wait for the version to arrive
+SCHEMA_PROFILES_ENABLED = False
+
+# seconds to wait for the broker version after connecting, every known
+# metric is subscribed to when it does not come
+SCHEMA_VERSION_TIMEOUT = 5.0
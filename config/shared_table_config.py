@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the shared memory metric table config variables
+"""
+
+# keep the latest value of every $SYS metric in a memory mapped file the
+# local agents can read instead of subscribing to $SYS/# themselves
+SHARED_TABLE_ENABLED = False
+
+# the table file, /dev/shm keeps it in memory
+SHARED_TABLE_PATH = "/dev/shm/mosquito_monitor.table"
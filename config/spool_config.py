@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the store and forward spool config variables
+"""
+
+SPOOL_PATH = "/home/as/mosquito_monitor.spool"
+
+# size of the memory mapped spool file in bytes, the oldest samples are
+# overwritten once it is full
+SPOOL_SIZE = 16 * 1024 * 1024
+
+# seconds to wait before trying to reach a sink which went away
+SPOOL_RETRY_INTERVAL = 5.0
+
+# statsd gauges carry no timestamp, only the latest spooled value of every
+# metric is sent once the sink is back, and only if it is not older than
+# this many seconds
+SPOOL_MAX_AGE = 24 * 60 * 60
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the per topic staleness detection config variables
+"""
+
+STALENESS_ENABLED = False
+
+# topics tracked, mosquitto publishes the other $SYS topics only when their
+# value changes, so they stop coming on a quiet broker. The uptime comes
+# every sys_interval and tells a broker gone silent
+STALE_TOPICS = ("$SYS/broker/uptime",)
+
+# resolution of the staleness deadlines in seconds, the wheel is advanced
+# at this interval
+STALE_TICK = 1.0
+
+# number of slots of the timer wheel, deadlines further away than
+# STALE_TICK * STALE_WHEEL_SLOTS go around the wheel more than once
+STALE_WHEEL_SLOTS = 512
+
+# a topic is stale after this many of its learned update periods without
+# update
+STALE_FACTOR = 5.0
+
+# a topic is never stale before this many seconds without update, also the
+# deadline of a topic not received yet
+STALE_MIN_AGE = 60.0
+
+# smoothing factor of the learned update period
+STALE_PERIOD_ALPHA = 0.2
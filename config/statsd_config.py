@@ -6,3 +6,13 @@ This file contains most of the bridge config variables
 STATSD_PORT = 8125
 
 STATSD_ADDRESS = "127.0.0.1"
+
+STATSD_PREFIX = "mosquito_monitor"
+
+# "udp" is fire and forget, "tcp" detects when the sink goes away and
+# spools the samples until it comes back, then sends the latest value of
+# every metric, statsd can not backfill the gap
+STATSD_PROTOCOL = "udp"
+
+# connect and send timeout of the tcp sink, in seconds
+STATSD_TCP_TIMEOUT = 1.0
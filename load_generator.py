@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the command line of the broker load generator
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, unicode_literals
+)
+
+import argparse
+
+from config.load_generator_config import (
+    LOADGEN_PUBLISHERS, LOADGEN_SUBSCRIBERS, LOADGEN_RATE, LOADGEN_TOPICS,
+    LOADGEN_PAYLOAD_SIZE, LOADGEN_QOS, LOADGEN_DURATION
+)
+from config.mqtt_config import (
+    LOCAL_MQTT_ADDRESS, LOCAL_MQTT_PORT, LOCAL_MQTT_CA_CERTS,
+    LOCAL_MQTT_TLS_INSECURE
+)
+from local_mqtt_client.load_generator import LoadGenerator
+from local_mqtt_client.tls import create_tls_context
+
+parser = argparse.ArgumentParser(
+    description="Generate publish load on a broker while the monitor "
+                "records its $SYS metrics"
+)
+parser.add_argument("--host", default=LOCAL_MQTT_ADDRESS)
+parser.add_argument("--port", type=int, default=LOCAL_MQTT_PORT)
+parser.add_argument("--username", default=None)
+parser.add_argument("--password", default=None)
+parser.add_argument(
+    "--tls", action="store_true", help="connect over tls, --port must then "
+                                       "point at a tls listener"
+)
+parser.add_argument(
+    "--ca-certs", default=LOCAL_MQTT_CA_CERTS,
+    help="ca bundle verifying the broker, the system one by default"
+)
+parser.add_argument(
+    "--insecure", action="store_true", default=LOCAL_MQTT_TLS_INSECURE,
+    help="skip the broker hostname check"
+)
+parser.add_argument("--publishers", type=int, default=LOADGEN_PUBLISHERS)
+parser.add_argument("--subscribers", type=int, default=LOADGEN_SUBSCRIBERS)
+parser.add_argument(
+    "--rate", type=float, default=LOADGEN_RATE,
+    help="total publishes per second"
+)
+parser.add_argument(
+    "--topics", type=int, default=LOADGEN_TOPICS,
+    help="number of topics the publishes are spread over"
+)
+parser.add_argument(
+    "--payload-size", type=int, default=LOADGEN_PAYLOAD_SIZE,
+    help="payload size in bytes"
+)
+parser.add_argument("--qos", type=int, choices=(0, 1, 2), default=LOADGEN_QOS)
+parser.add_argument(
+    "--duration", type=float, default=LOADGEN_DURATION,
+    help="run time in seconds"
+)
+args = parser.parse_args()
+
+tls_context = None
+if args.tls:
+    tls_context = create_tls_context(
+        ca_certs=args.ca_certs, insecure=args.insecure
+    )
+
+load_generator = LoadGenerator(
+    publishers=args.publishers, subscribers=args.subscribers, rate=args.rate,
+    topics=args.topics, payload_size=args.payload_size, qos=args.qos,
+    host=args.host, port=args.port, username=args.username,
+    password=args.password, tls_context=tls_context
+)
+load_generator.run(duration=args.duration)
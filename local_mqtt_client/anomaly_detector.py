@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the streaming anomaly detector used on broker metrics
+"""
+
+import math
+
+from config.anomaly_config import (
+    ANOMALY_EWMA_ALPHA, ANOMALY_Z_THRESHOLD, ANOMALY_WARMUP_SAMPLES,
+    ANOMALY_MIN_STD, ANOMALY_METRICS
+)
+from config.statsd_config import STATSD_PREFIX
+
+
+class _EwmaState:
+    """
+    Constant size state kept for every watched metric
+    """
+    __slots__ = (
+        "delta", "mean", "variance", "count", "score_name", "flag_name"
+    )
+
+    def __init__(self, delta: bool, score_name: str, flag_name: str):
+        self.delta = delta
+        self.mean = 0.0
+        self.variance = 0.0
+        self.count = 0
+        self.score_name = score_name
+        self.flag_name = flag_name
+
+
+class AnomalyDetector:
+    """
+    This class keeps an exponentially weighted mean and variance per metric
+    and scores every new sample against them (a z-score). Memory use is
+    constant per metric, no sample history is kept.
+    """
+    def __init__(
+            self, registry, metrics: dict=None,
+            alpha: float=ANOMALY_EWMA_ALPHA,
+            threshold: float=ANOMALY_Z_THRESHOLD,
+            warmup: int=ANOMALY_WARMUP_SAMPLES, min_std: float=ANOMALY_MIN_STD
+    ):
+        """
+        :param registry: the metric registry holding the metric values
+        :param metrics: dict of metric name to mode ("level" or "delta")
+        :param alpha: smoothing factor of the mean and variance
+        :param threshold: z-score above which a sample is flagged
+        :param warmup: number of samples before any sample is flagged
+        :param min_std: floor of the standard deviation
+        """
+        if metrics is None:
+            metrics = ANOMALY_METRICS
+
+        self._registry = registry
+        self._alpha = alpha
+        self._threshold = threshold
+        self._warmup = warmup
+        self._min_std = min_std
+
+        self._states = [None] * len(registry)
+        for metric, mode in metrics.items():
+            descriptor = registry.by_name.get(metric)
+            if descriptor is None:
+                continue
+
+            anomaly_metric = "{}.anomaly.{}".format(
+                STATSD_PREFIX, metric[len(STATSD_PREFIX) + 1:]
+            )
+            self._states[descriptor.metric_id] = _EwmaState(
+                mode == "delta", anomaly_metric + ".score",
+                anomaly_metric + ".flag"
+            )
+
+    def metric_names(self, metric_id: int) -> tuple:
+        """
+        This function returns the statsd names of the anomaly metrics
+        :param metric_id: the metric id
+        :return: tuple of (score metric name, flag metric name)
+        """
+        state = self._states[metric_id]
+        return state.score_name, state.flag_name
+
+    def update(self, metric_id: int, value: float):
+        """
+        This function feeds a new sample to the detector, the registry must
+        already hold the sample
+        :param metric_id: the metric id
+        :param value: the sample value
+        :return: tuple of (score, flag) or None while there is nothing to
+        score yet (unwatched metric, or first sample of a delta metric)
+        """
+        state = self._states[metric_id]
+        if state is None:
+            return None
+
+        if state.delta:
+            value = self._registry.delta(metric_id)
+            if value is None:
+                return None
+            # a counter going backwards means the broker restarted, the
+            # sample is not a jump
+            value = max(value, 0.0)
+
+        if state.count == 0:
+            state.mean = value
+            state.count = 1
+            return 0.0, False
+
+        std = max(math.sqrt(state.variance), self._min_std)
+        deviation = value - state.mean
+        score = abs(deviation) / std
+        flag = state.count >= self._warmup and score > self._threshold
+
+        if flag:
+            # clip the sample so one spike does not drag the baseline along
+            deviation = math.copysign(self._threshold * std, deviation)
+
+        increment = self._alpha * deviation
+        state.mean += increment
+        state.variance = (1 - self._alpha) * (
+            state.variance + deviation * increment
+        )
+        state.count += 1
+
+        return score, flag
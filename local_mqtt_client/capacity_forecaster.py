@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the capacity forecaster used on broker metrics
+"""
+
+from array import array
+
+from config.forecast_config import (
+    FORECAST_BUCKET, FORECAST_WINDOW, FORECAST_MIN_POINTS, FORECAST_HORIZON,
+    FORECAST_METRICS
+)
+from config.statsd_config import STATSD_PREFIX
+
+
+class _TrendState:
+    """
+    Constant size state kept for every forecast metric
+    """
+    __slots__ = (
+        "limit", "limit_id", "bucket_start", "bucket_time", "bucket_sum",
+        "bucket_count", "xs", "ys", "head", "count", "origin", "sx", "sy",
+        "sxx", "sxy", "exhaustion_name", "slope_name"
+    )
+
+    def __init__(
+            self, limit, limit_id, window: int, exhaustion_name: str,
+            slope_name: str
+    ):
+        self.limit = limit
+        self.limit_id = limit_id
+        self.bucket_start = 0.0
+        self.bucket_time = 0.0
+        self.bucket_sum = 0.0
+        self.bucket_count = 0
+        self.xs = array('d', [0.0]) * window
+        self.ys = array('d', [0.0]) * window
+        self.head = 0
+        self.count = 0
+        self.origin = 0.0
+        self.sx = 0.0
+        self.sy = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+        self.exhaustion_name = exhaustion_name
+        self.slope_name = slope_name
+
+
+class CapacityForecaster:
+    """
+    This class fits a least squares line on a rolling window of every
+    forecast metric and sends how long until the line crosses the limit of
+    the metric. Samples are averaged into fixed length buckets and the
+    window holds a fixed number of bucket means, the sums of the regression
+    are updated when a point enters and leaves the window, so a sample
+    costs O(1) whatever the window length.
+    """
+    def __init__(
+            self, registry, metrics: dict=None,
+            bucket: float=FORECAST_BUCKET, window: int=FORECAST_WINDOW,
+            min_points: int=FORECAST_MIN_POINTS,
+            horizon: float=FORECAST_HORIZON
+    ):
+        """
+        :param registry: the metric registry holding the metric values
+        :param metrics: dict of metric name to limit, a number or the name
+        of the metric holding the limit
+        :param bucket: seconds of samples averaged into one point
+        :param window: number of points in the window
+        :param min_points: points needed before a forecast is made
+        :param horizon: longest time to exhaustion sent
+        """
+        if metrics is None:
+            metrics = FORECAST_METRICS
+
+        self._registry = registry
+        self._bucket = bucket
+        self._window = window
+        self._min_points = max(min_points, 2)
+        self._horizon = horizon
+
+        self._states = [None] * len(registry)
+        for metric, limit in metrics.items():
+            descriptor = registry.by_name.get(metric)
+            if descriptor is None:
+                continue
+
+            limit_id = None
+            if isinstance(limit, str):
+                limit_descriptor = registry.by_name.get(limit)
+                if limit_descriptor is None:
+                    continue
+                limit_id = limit_descriptor.metric_id
+
+            forecast_metric = "{}.forecast.{}".format(
+                STATSD_PREFIX, metric[len(STATSD_PREFIX) + 1:]
+            )
+            self._states[descriptor.metric_id] = _TrendState(
+                limit, limit_id, window,
+                forecast_metric + ".time_to_exhaustion",
+                forecast_metric + ".slope"
+            )
+
+    def update(self, metric_id: int, value: float):
+        """
+        This function feeds a new sample to the forecaster, the registry
+        must already hold the sample
+        :param metric_id: the metric id
+        :param value: the sample value
+        :return: list of (metric name, value) when a bucket closed and a
+        forecast was made, None otherwise
+        """
+        state = self._states[metric_id]
+        if state is None:
+            return None
+
+        timestamp = self._registry.timestamp[metric_id]
+        forecast = None
+
+        if (
+                state.bucket_count and
+                timestamp - state.bucket_start >= self._bucket
+        ):
+            self._add_point(
+                state, state.bucket_time / state.bucket_count,
+                state.bucket_sum / state.bucket_count
+            )
+            state.bucket_time = state.bucket_sum = 0.0
+            state.bucket_count = 0
+            forecast = self._forecast(state, timestamp)
+
+        if state.bucket_count == 0:
+            state.bucket_start = timestamp
+        state.bucket_time += timestamp
+        state.bucket_sum += value
+        state.bucket_count += 1
+
+        return forecast
+
+    def _add_point(self, state: _TrendState, x: float, y: float) -> None:
+        """
+        This function adds a bucket mean to the window, replacing the
+        oldest point of a full window
+        :param state: the metric state
+        :param x: the mean timestamp of the bucket
+        :param y: the mean value of the bucket
+        :return: None
+        """
+        if state.count == 0:
+            state.origin = x
+        # the times are kept relative to an origin so the sums stay small
+        x -= state.origin
+
+        head = state.head
+        if state.count == self._window:
+            old_x = state.xs[head]
+            old_y = state.ys[head]
+            state.sx -= old_x
+            state.sy -= old_y
+            state.sxx -= old_x * old_x
+            state.sxy -= old_x * old_y
+        else:
+            state.count += 1
+
+        state.xs[head] = x
+        state.ys[head] = y
+        state.sx += x
+        state.sy += y
+        state.sxx += x * x
+        state.sxy += x * y
+        state.head = (head + 1) % self._window
+
+        if state.head == 0 and state.count == self._window:
+            self._rebase(state)
+
+    def _rebase(self, state: _TrendState) -> None:
+        """
+        This function moves the origin to the oldest point and recomputes
+        the sums, done once per window so the rounding errors of the
+        incremental updates do not pile up
+        :param state: the metric state
+        :return: None
+        """
+        offset = state.xs[state.head]
+        state.origin += offset
+        state.sx = state.sy = state.sxx = state.sxy = 0.0
+        for index in range(state.count):
+            x = state.xs[index] - offset
+            y = state.ys[index]
+            state.xs[index] = x
+            state.sx += x
+            state.sy += y
+            state.sxx += x * x
+            state.sxy += x * y
+
+    def _forecast(self, state: _TrendState, now: float):
+        """
+        This function computes the time to exhaustion from the fitted line
+        :param state: the metric state
+        :param now: the current timestamp
+        :return: list of (metric name, value) or None while there are not
+        enough points
+        """
+        count = state.count
+        if count < self._min_points:
+            return None
+
+        denominator = count * state.sxx - state.sx * state.sx
+        if denominator <= 0.0:
+            return None
+
+        slope = (count * state.sxy - state.sx * state.sy) / denominator
+        intercept = (state.sy - slope * state.sx) / count
+        fitted = intercept + slope * (now - state.origin)
+
+        limit = state.limit
+        if state.limit_id is not None:
+            limit = self._registry.current[state.limit_id]
+
+        if slope <= 0.0:
+            exhaustion = self._horizon
+        else:
+            exhaustion = min(
+                max((limit - fitted) / slope, 0.0), self._horizon
+            )
+
+        return [
+            (state.exhaustion_name, exhaustion),
+            (state.slope_name, slope),
+        ]
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the client churn tracker fed by the broker log topic
+"""
+
+from config.churn_config import (
+    CHURN_TRACKED_CLIENTS, CHURN_RECONNECT_THRESHOLD
+)
+from config.statsd_config import STATSD_PREFIX
+from local_mqtt_client.mosquitto_log import (
+    EVENTS, EVENT_CONNECT, parse_log_line
+)
+
+
+class HeavyHitters:
+    """
+    This class counts the most frequent keys with a fixed number of counters
+    (the Space-Saving algorithm). A key missing from a full table takes over
+    the smallest counter, so a count may be overestimated by at most the
+    error kept next to it, but a frequent key is never missed.
+    """
+    def __init__(self, capacity: int):
+        """
+        :param capacity: number of counters
+        """
+        self._capacity = capacity
+        self._counters = dict()
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def add(self, key) -> None:
+        """
+        This function counts one occurrence of the key
+        :param key: the key
+        :return: None
+        """
+        counter = self._counters.get(key)
+        if counter is not None:
+            counter[0] += 1
+            return
+
+        if len(self._counters) < self._capacity:
+            self._counters[key] = [1, 0]
+            return
+
+        evicted = min(self._counters, key=lambda k: self._counters[k][0])
+        minimum = self._counters.pop(evicted)[0]
+        self._counters[key] = [minimum + 1, minimum]
+
+    def top(self, count: int=None) -> list:
+        """
+        This function returns the most frequent keys
+        :param count: number of keys to return, all when None
+        :return: list of (key, count, error) sorted by count
+        """
+        ranked = sorted(
+            ((key, value[0], value[1])
+             for key, value in self._counters.items()),
+            key=lambda item: item[1], reverse=True
+        )
+        return ranked[:count] if count is not None else ranked
+
+    def clear(self) -> None:
+        self._counters.clear()
+
+
+class ChurnTracker:
+    """
+    This class counts the connection events of the broker log messages and
+    keeps the client ids connecting the most in bounded memory, to find the
+    clients stuck in a reconnect loop
+    """
+    def __init__(
+            self, tracked_clients: int=CHURN_TRACKED_CLIENTS,
+            reconnect_threshold: int=CHURN_RECONNECT_THRESHOLD
+    ):
+        """
+        :param tracked_clients: number of client ids tracked
+        :param reconnect_threshold: connects in one window making a client
+        a reconnect loop offender
+        """
+        self._reconnect_threshold = reconnect_threshold
+        self._counts = dict.fromkeys(EVENTS, 0)
+        self._connects = HeavyHitters(tracked_clients)
+        self._prefix = "{}.churn.".format(STATSD_PREFIX)
+
+    def add_log_line(self, line: bytes) -> None:
+        """
+        This function counts the event of a broker log line
+        :param line: the log message payload
+        :return: None
+        """
+        parsed = parse_log_line(line)
+        if parsed is None:
+            return
+
+        event, client_id = parsed
+        self._counts[event] += 1
+        if event == EVENT_CONNECT and client_id is not None:
+            self._connects.add(client_id)
+
+    def flush(self, elapsed: float) -> tuple:
+        """
+        This function closes the window
+        :param elapsed: length of the window in seconds
+        :return: tuple of (list of (metric name, value), list of
+        (client id, connects) of the reconnect loop offenders)
+        """
+        prefix = self._prefix
+        samples = [
+            (prefix + event, self._counts[event] / elapsed)
+            for event in EVENTS
+        ]
+
+        top = self._connects.top()
+        offenders = [
+            (client_id.decode("utf-8", "replace"), count)
+            for client_id, count, error in top
+            if count - error >= self._reconnect_threshold
+        ]
+        samples.append((prefix + "offenders", len(offenders)))
+        samples.append(
+            (prefix + "top_client_connects", top[0][1] if top else 0)
+        )
+
+        self._counts = dict.fromkeys(EVENTS, 0)
+        self._connects.clear()
+        return samples, offenders
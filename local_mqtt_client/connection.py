@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the connection setup shared by all broker clients
+"""
+
+from config.mqtt_config import (
+    LOCAL_MQTT_ADDRESS, LOCAL_MQTT_PORT, LOCAL_MQTT_KEEPALIVE
+)
+
+
+def connect_client(
+        client, logger, host: str=LOCAL_MQTT_ADDRESS,
+        port: int=LOCAL_MQTT_PORT, keepalive: int=LOCAL_MQTT_KEEPALIVE,
+        tls_context=None, properties=None
+) -> None:
+    """
+    This function calls the connect function on the client object, the
+    connection is made by the network loop, which also reconnects
+    :param client: the paho client
+    :param logger: the logger of the caller
+    :param host: the broker address
+    :param port: the broker port
+    :param keepalive: the keepalive in seconds
+    :param tls_context: the tls context, None for plain tcp
+    :param properties: the MQTT v5 connect properties, None for 3.1.1
+    :return: None
+    """
+    if tls_context is not None:
+        client.tls_set_context(tls_context)
+
+    try:
+        logger.info(
+            "Attempting to connect to local MQTT server.",
+            server=host, port=port, kepalive=keepalive,
+            tls=tls_context is not None, mqtt5=properties is not None
+        )
+
+        if properties is None:
+            client.connect_async(host=host, port=port, keepalive=keepalive)
+        else:
+            client.connect_async(
+                host=host, port=port, keepalive=keepalive, clean_start=True,
+                properties=properties
+            )
+
+    except Exception as e:
+        # exception was raised during the connect function, we must wait
+        # for ok connection
+        logger.error("Unable to connect to MQTT Broker", error=e)
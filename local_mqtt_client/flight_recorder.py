@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the in memory flight recorder of the $SYS traffic
+"""
+
+import json
+import logging.config
+import os
+import os.path as osp
+import pathlib
+import signal
+import struct
+import time
+
+import structlog
+
+from config import logging_config
+from config.flight_recorder_config import (
+    FLIGHT_RECORDER_SIZE, FLIGHT_RECORDER_PAYLOAD_SIZE,
+    FLIGHT_RECORDER_DUMP_DIR, FLIGHT_RECORDER_DUMP_INTERVAL
+)
+
+# topic index used once the topic table is full
+_OTHER_TOPIC = 0xFFFF
+_OTHER_TOPIC_NAME = "<other>"
+
+
+class FlightRecorder:
+    """
+    This class keeps the last messages received in a ring of fixed size
+    records: receive time, handler duration, an index into a table of the
+    topics seen and the payload truncated to a fixed length. Recording a
+    message is a single struct pack into a preallocated buffer, nothing is
+    written to disk until the ring is dumped, either on SIGUSR1 or when a
+    handler raises.
+    """
+    def __init__(
+            self, size: int=FLIGHT_RECORDER_SIZE,
+            payload_size: int=FLIGHT_RECORDER_PAYLOAD_SIZE,
+            dump_dir: str=FLIGHT_RECORDER_DUMP_DIR,
+            dump_interval: float=FLIGHT_RECORDER_DUMP_INTERVAL
+    ):
+        """
+        :param size: number of messages kept
+        :param payload_size: payload bytes kept per message
+        :param dump_dir: directory the dumps are written to
+        :param dump_interval: minimum seconds between two failure dumps
+        """
+        logging.config.dictConfig(logging_config.get_logging_conf())
+        self._logger = structlog.getLogger(__name__)
+        self._logger.addHandler(logging.NullHandler())
+
+        # receive time, handler duration, topic index, failed flag, payload
+        # length before truncation and the truncated payload
+        self._record = struct.Struct(
+            "<ddHBI{}s".format(payload_size)
+        )
+        self._size = size
+        self._buffer = bytearray(self._record.size * size)
+        self._written = 0
+
+        self._topics = list()
+        self._topic_index = dict()
+
+        self._dump_dir = dump_dir
+        self._dump_interval = dump_interval
+        self._last_failure_dump = None
+
+    def install_signal_handler(self, signum: int=signal.SIGUSR1) -> None:
+        """
+        This function dumps the ring whenever the signal is received, it
+        must be called from the main thread
+        :param signum: the signal
+        :return: None
+        """
+        signal.signal(signum, self._on_signal)
+
+    def _on_signal(self, signum, frame) -> None:
+        self.dump("signal")
+
+    def record(
+            self, topic: str, payload: bytes, received_at: float,
+            duration: float, failed: bool=False
+    ) -> None:
+        """
+        This function adds a message to the ring, overwriting the oldest one
+        :param topic: the message topic
+        :param payload: the message payload
+        :param received_at: the wall clock receive time
+        :param duration: the handler duration in seconds
+        :param failed: True if the handler raised
+        :return: None
+        """
+        index = self._topic_index.get(topic)
+        if index is None:
+            index = self._intern(topic)
+
+        slot = self._written % self._size
+        self._record.pack_into(
+            self._buffer, slot * self._record.size, received_at, duration,
+            index, failed, len(payload), payload
+        )
+        self._written += 1
+
+    def _intern(self, topic: str) -> int:
+        if len(self._topics) >= _OTHER_TOPIC:
+            return _OTHER_TOPIC
+        index = len(self._topics)
+        self._topics.append(topic)
+        self._topic_index[topic] = index
+        return index
+
+    def records(self) -> list:
+        """
+        This function returns the recorded messages, oldest first
+        :return: list of (received_at, duration, topic, failed, payload
+        length, truncated payload)
+        """
+        # copy first, a message may be recorded while this runs
+        written = self._written
+        buffer = bytes(self._buffer)
+        topics = list(self._topics)
+
+        count = min(written, self._size)
+        records = list()
+        for position in range(written - count, written):
+            received_at, duration, index, failed, length, payload = (
+                self._record.unpack_from(
+                    buffer, (position % self._size) * self._record.size
+                )
+            )
+            topic = (
+                topics[index] if index < len(topics) else _OTHER_TOPIC_NAME
+            )
+            records.append((
+                received_at, duration, topic, bool(failed), length,
+                payload[:length]
+            ))
+        return records
+
+    def dump_on_failure(self) -> None:
+        """
+        This function dumps the ring after a failing handler, at most once
+        per dump interval
+        :return: None
+        """
+        now = time.monotonic()
+        if (
+                self._last_failure_dump is not None and
+                now - self._last_failure_dump < self._dump_interval
+        ):
+            return
+        self._last_failure_dump = now
+        self.dump("failure")
+
+    def dump(self, reason: str):
+        """
+        This function writes the ring to a new file, one json document per
+        message
+        :param reason: why the ring is dumped, part of the file name
+        :return: the dump file path or None if it could not be written
+        """
+        path = osp.join(
+            self._dump_dir, "mosquito_monitor-flight-{}-{}-{}.jsonl".format(
+                time.strftime("%Y%m%d-%H%M%S"), os.getpid(), reason
+            )
+        )
+
+        try:
+            pathlib.Path(self._dump_dir).mkdir(parents=True, exist_ok=True)
+            records = self.records()
+            with open(path, "w") as dump:
+                for (
+                        received_at, duration, topic, failed, length, payload
+                ) in records:
+                    dump.write(json.dumps({
+                        "received_at": received_at,
+                        "duration_ms": duration * 1000.0,
+                        "topic": topic,
+                        "failed": failed,
+                        "payload": payload.decode("utf-8", "replace"),
+                        "payload_length": length,
+                    }))
+                    dump.write("\n")
+        except Exception as e:
+            # the recorder must never take the monitor down
+            self._logger.error(
+                "Error dumping the flight recorder", path=path, error=e
+            )
+            return None
+
+        self._logger.info(
+            "Flight recorder dumped", path=path, reason=reason,
+            messages=len(records)
+        )
+        return path
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the scheduler flushing the collected metrics once per
+interval
+"""
+
+import logging.config
+import math
+import threading
+import time
+
+import structlog
+
+from config import logging_config
+from config.scheduler_config import FLUSH_INTERVAL, FLUSH_PHASE
+
+
+class FlushScheduler:
+    """
+    This class calls a flush function from a thread exactly once per
+    interval, at a fixed phase of the wall clock interval boundaries, so the
+    flushes line up with the netdata collection ticks. Sleeping is done on
+    the monotonic clock, the wall clock is only read to pick the phase. The
+    flush function gets the timing of the scheduler itself: how late it woke
+    up, how long the previous flush took and how many boundaries were missed.
+    """
+    def __init__(
+            self, flush, interval: float=FLUSH_INTERVAL,
+            phase: float=FLUSH_PHASE
+    ):
+        """
+        :param flush: function called with a dict of jitter, flush_duration
+        and missed
+        :param interval: seconds between two flushes
+        :param phase: fraction of the interval after the boundary at which
+        the flush happens
+        """
+        logging.config.dictConfig(logging_config.get_logging_conf())
+        self._logger = structlog.getLogger(__name__)
+        self._logger.addHandler(logging.NullHandler())
+
+        self._flush = flush
+        self._interval = interval
+        self._phase = phase
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="flush_scheduler", daemon=True
+        )
+
+    def start(self) -> None:
+        """
+        This function starts the scheduler thread
+        :return: None
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        This function stops the scheduler thread
+        :return: None
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def _first_deadline(self) -> float:
+        """
+        This function returns the monotonic time of the next aligned flush
+        :return: the deadline on the monotonic clock
+        """
+        wall = time.time()
+        monotonic = time.monotonic()
+        offset = self._phase * self._interval
+        boundary = (
+            math.floor((wall - offset) / self._interval) + 1
+        ) * self._interval + offset
+        return monotonic + (boundary - wall)
+
+    def _run(self) -> None:
+        """
+        This function is the scheduler thread loop
+        :return: None
+        """
+        deadline = self._first_deadline()
+        flush_duration = 0.0
+
+        while not self._stop.wait(max(deadline - time.monotonic(), 0.0)):
+            woke = time.monotonic()
+            jitter = woke - deadline
+
+            # an overrun skips the boundaries already gone, never flushes
+            # twice in one interval
+            missed = int(jitter // self._interval)
+            deadline += (missed + 1) * self._interval
+
+            try:
+                self._flush({
+                    "jitter": jitter,
+                    "flush_duration": flush_duration,
+                    "missed": missed,
+                })
+            except Exception as e:
+                self._logger.error("Error flushing the metrics", error=e)
+
+            flush_duration = time.monotonic() - woke
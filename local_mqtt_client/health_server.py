@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the http health endpoint of the collector
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from config.health_config import HEALTH_ADDRESS, HEALTH_PORT
+
+
+class _HealthRequestHandler(BaseHTTPRequestHandler):
+    """
+    This class answers GET /live, /ready and /status with the watchdog
+    status as json, /live and /ready return 503 when the check fails.
+    GET /profile?seconds=n starts a profiling session when a profiler is
+    given, it answers 409 while a session is already running.
+    """
+    def do_GET(self) -> None:
+        if urlsplit(self.path).path == "/profile":
+            self._profile()
+            return
+
+        status = self.server.watchdog.status()
+
+        if self.path == "/live":
+            code = 200 if status["live"] else 503
+        elif self.path == "/ready":
+            code = 200 if status["ready"] else 503
+        elif self.path == "/status":
+            code = 200
+        else:
+            self.send_error(404)
+            return
+
+        self._send_json(code, status)
+
+    def _profile(self) -> None:
+        profiler = self.server.profiler
+        if profiler is None:
+            self.send_error(404)
+            return
+
+        query = parse_qs(urlsplit(self.path).query)
+        try:
+            duration = (
+                float(query["seconds"][0]) if "seconds" in query else None
+            )
+        except ValueError:
+            self.send_error(400)
+            return
+
+        started = profiler.start("endpoint", duration)
+        self._send_json(202 if started else 409, {"started": started})
+
+    def _send_json(self, code: int, document: dict) -> None:
+        body = json.dumps(document).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        # probes come every few seconds, keep them out of the log
+        pass
+
+
+class HealthServer:
+    """
+    This class serves the health endpoint from a daemon thread
+    """
+    def __init__(
+            self, watchdog, profiler=None, address: str=HEALTH_ADDRESS,
+            port: int=HEALTH_PORT
+    ):
+        """
+        :param watchdog: the watchdog providing the status
+        :param profiler: the profiler started by /profile, may be None
+        :param address: the address to listen on
+        :param port: the port to listen on
+        """
+        self._server = HTTPServer((address, port), _HealthRequestHandler)
+        self._server.watchdog = watchdog
+        self._server.profiler = profiler
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="health_server",
+            daemon=True
+        )
+
+    def start(self) -> None:
+        """
+        This function starts serving requests
+        :return: None
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        This function stops serving requests and closes the socket
+        :return: None
+        """
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the leader election between redundant collectors
+"""
+
+import json
+import logging.config
+import os
+import socket
+import threading
+import time
+
+import structlog
+
+from config import logging_config
+from config.ha_config import HA_LEASE_TOPIC, HA_LEASE_TTL, HA_HEARTBEAT
+
+
+class LeaderElection:
+    """
+    This class elects one leader among the collectors of a broker with a
+    retained lease message on the broker itself. The leader publishes the
+    lease with its id every heartbeat. A standby takes the lease over once
+    no lease was received for the lease ttl. The broker delivers the lease
+    messages to every collector in the same order, so the last lease
+    received names the leader for all of them, and a collector only leads
+    once it received its own lease back. The times are measured on the
+    local monotonic clock from the receive time, the clocks of the hosts
+    are never compared. While standby the metric sink is disabled.
+    """
+    def __init__(
+            self, client, sink, topic: str=HA_LEASE_TOPIC,
+            ttl: float=HA_LEASE_TTL, heartbeat: float=HA_HEARTBEAT
+    ):
+        """
+        :param client: the paho client
+        :param sink: the metric sink enabled while leading
+        :param topic: the retained lease topic
+        :param ttl: seconds a lease is valid without heartbeat
+        :param heartbeat: seconds between two lease heartbeats
+        """
+        logging.config.dictConfig(logging_config.get_logging_conf())
+        self._logger = structlog.getLogger(__name__)
+        self._logger.addHandler(logging.NullHandler())
+
+        self._client = client
+        self._sink = sink
+        self._topic = topic
+        self._ttl = ttl
+        self._heartbeat = heartbeat
+
+        self.node_id = "{}-{}".format(socket.gethostname(), os.getpid())
+        self.is_leader = False
+        self.connected = False
+        self.takeovers = 0
+
+        self._holder = None
+        self._holder_ttl = ttl
+        self._lease_seen = None
+        self._own_lease_seen = None
+        self._observers = list()
+
+        # standby until elected
+        self._sink.enabled = False
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="leader_election", daemon=True
+        )
+
+        self._client.message_callback_add(self._topic, self._on_lease)
+
+    def add_observer(self, observer) -> None:
+        """
+        This function registers a function called on every role change
+        :param observer: function called with True when the collector
+        leads and False when it stands by
+        :return: None
+        """
+        self._observers.append(observer)
+
+    def start(self) -> None:
+        """
+        This function starts the election thread
+        :return: None
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        This function stops the election thread, a leader releases the
+        lease so a standby takes over right away
+        :return: None
+        """
+        self._stop.set()
+        self._thread.join()
+        if self.is_leader:
+            self._client.publish(self._topic, b"", qos=1, retain=True)
+            self._set_leader(False)
+
+    def on_connect(self) -> None:
+        """
+        This function subscribes to the lease topic, called on connect
+        :return: None
+        """
+        self.connected = True
+        # the retained lease comes right after the subscription, when there
+        # is none the lease is free after one heartbeat
+        self._holder = None
+        self._holder_ttl = self._heartbeat
+        self._lease_seen = time.monotonic()
+        self._client.subscribe(self._topic, qos=1)
+
+    def on_disconnect(self) -> None:
+        """
+        This function steps down, the standby can not be told apart from a
+        leader which lost the broker, called on disconnect
+        :return: None
+        """
+        self.connected = False
+        self._set_leader(False)
+
+    def _on_lease(self, client, userdata, msg) -> None:
+        """
+        This function receives a lease in the paho thread
+        :param client: the client object
+        :param userdata: the data set by user on startup
+        :param msg: the lease message
+        :return: None
+        """
+        now = time.monotonic()
+        holder = None
+        ttl = self._ttl
+        if msg.payload:
+            try:
+                lease = json.loads(msg.payload.decode("utf-8"))
+                holder = lease["holder"]
+                ttl = float(lease["ttl"])
+            except (ValueError, KeyError, TypeError) as e:
+                self._logger.error(
+                    "Invalid lease message", payload=msg.payload, error=e
+                )
+                return
+
+        self._holder = holder
+        self._holder_ttl = ttl if holder is not None else 0.0
+        self._lease_seen = now
+        if holder == self.node_id:
+            self._own_lease_seen = now
+        self._set_leader(holder == self.node_id)
+
+    def _run(self) -> None:
+        """
+        This function is the election thread loop
+        :return: None
+        """
+        while not self._stop.wait(self._heartbeat):
+            if not self.connected or self._lease_seen is None:
+                continue
+
+            now = time.monotonic()
+            if self.is_leader:
+                if now - self._own_lease_seen > self._ttl:
+                    # our own heartbeats stopped coming back, another
+                    # collector may lead already
+                    self._logger.warning(
+                        "Lease heartbeat lost, stepping down",
+                        node_id=self.node_id
+                    )
+                    self._set_leader(False)
+                    continue
+                self._publish_lease()
+            elif now - self._lease_seen > self._holder_ttl:
+                self._logger.info(
+                    "Lease expired, taking over", node_id=self.node_id,
+                    previous_holder=self._holder
+                )
+                self._publish_lease()
+
+    def _publish_lease(self) -> None:
+        """
+        This function publishes the lease naming this collector
+        :return: None
+        """
+        lease = json.dumps({"holder": self.node_id, "ttl": self._ttl})
+        self._client.publish(
+            self._topic, lease.encode("utf-8"), qos=1, retain=True
+        )
+
+    def _set_leader(self, leader: bool) -> None:
+        """
+        This function switches between leader and standby
+        :param leader: True to lead
+        :return: None
+        """
+        if leader == self.is_leader:
+            return
+
+        self.is_leader = leader
+        self._sink.enabled = leader
+        if leader:
+            self.takeovers += 1
+            self._own_lease_seen = time.monotonic()
+        for observer in self._observers:
+            observer(leader)
+        self._logger.info(
+            "Leader election changed role", node_id=self.node_id,
+            role="leader" if leader else "standby", holder=self._holder
+        )
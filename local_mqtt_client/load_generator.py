@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the broker load generator used for capacity testing
+"""
+
+import logging.config
+import os
+import time
+
+import paho.mqtt.client as mqtt
+import structlog
+
+from config import logging_config
+from config.load_generator_config import (
+    LOADGEN_PUBLISHERS, LOADGEN_SUBSCRIBERS, LOADGEN_RATE, LOADGEN_TOPICS,
+    LOADGEN_PAYLOAD_SIZE, LOADGEN_QOS, LOADGEN_DURATION, LOADGEN_TOPIC_PREFIX,
+    LOADGEN_REPORT_INTERVAL, LOADGEN_SPOOL_PATH, LOADGEN_SPOOL_SIZE
+)
+from config.mqtt_config import LOCAL_MQTT_ADDRESS, LOCAL_MQTT_PORT
+from config.statsd_config import STATSD_PREFIX, STATSD_PROTOCOL
+from local_mqtt_client.connection import connect_client
+from local_mqtt_client.metric_sink import MetricSink
+from local_mqtt_client.metric_spool import MetricSpool
+
+# seconds to wait for all the connections before giving up
+_CONNECT_TIMEOUT = 30.0
+
+
+class LoadGenerator:
+    """
+    This class opens publisher and subscriber connections to a broker and
+    publishes at a target rate spread over a set of topics, reporting the
+    sent, acknowledged and received rates to the log and to statsd.
+    """
+    def __init__(
+            self, publishers: int=LOADGEN_PUBLISHERS,
+            subscribers: int=LOADGEN_SUBSCRIBERS, rate: float=LOADGEN_RATE,
+            topics: int=LOADGEN_TOPICS,
+            payload_size: int=LOADGEN_PAYLOAD_SIZE, qos: int=LOADGEN_QOS,
+            host: str=LOCAL_MQTT_ADDRESS, port: int=LOCAL_MQTT_PORT,
+            username: str=None, password: str=None, tls_context=None
+    ):
+        """
+        :param publishers: number of publishing connections
+        :param subscribers: number of subscribing connections, every one
+        of them receives all the publishes
+        :param rate: total publish rate in messages per second
+        :param topics: number of topics the publishes are spread over
+        :param payload_size: payload size in bytes
+        :param qos: qos of the publishes and subscriptions
+        :param host: the broker address
+        :param port: the broker port
+        :param username: the broker username, None for anonymous
+        :param password: the broker password
+        :param tls_context: the tls context shared by the connections, None
+        for plain tcp
+        """
+        logging.config.dictConfig(logging_config.get_logging_conf())
+        self._logger = structlog.getLogger(__name__)
+        self._logger.addHandler(logging.NullHandler())
+
+        self._rate = rate
+        self._qos = qos
+        self._host = host
+        self._port = port
+        self._username = username
+        self._password = password
+        self._tls_context = tls_context
+
+        self._topics = [
+            "{}/{}".format(LOADGEN_TOPIC_PREFIX, index)
+            for index in range(topics)
+        ]
+        self._payload = b"x" * payload_size
+        # a spool of its own, two processes must not share a spool file
+        spool = None
+        if STATSD_PROTOCOL == "tcp":
+            spool = MetricSpool(LOADGEN_SPOOL_PATH, LOADGEN_SPOOL_SIZE)
+        self._sink = MetricSink(spool=spool)
+
+        # every counter is only written by the thread of its own connection
+        self._acked = [0] * publishers
+        self._received = [0] * subscribers
+        self._connected = set()
+
+        self._publishers = [
+            self._make_client("pub", index, self._make_on_publish(index))
+            for index in range(publishers)
+        ]
+        self._subscribers = [
+            self._make_client(
+                "sub", index, None, self._make_on_message(index)
+            )
+            for index in range(subscribers)
+        ]
+
+    def _make_client(
+            self, role: str, index: int, on_publish, on_message=None
+    ):
+        """
+        This function creates one connection and starts its network loop
+        :param role: "pub" or "sub"
+        :param index: the index of the connection in its role
+        :param on_publish: the publish acknowledgement callback
+        :param on_message: the message callback
+        :return: the paho client
+        """
+        client_id = "loadgen-{}-{}-{}".format(role, os.getpid(), index)
+        client = mqtt.Client(
+            client_id=client_id, clean_session=True, protocol=mqtt.MQTTv311
+        )
+        client.max_inflight_messages_set(1000)
+        client.on_connect = self._make_on_connect(client_id, role == "sub")
+        if on_publish is not None:
+            client.on_publish = on_publish
+        if on_message is not None:
+            client.on_message = on_message
+        if self._username is not None:
+            client.username_pw_set(
+                username=self._username, password=self._password
+            )
+
+        connect_client(
+            client, self._logger, host=self._host, port=self._port,
+            tls_context=self._tls_context
+        )
+        client.loop_start()
+        return client
+
+    def _make_on_connect(self, client_id: str, subscribe: bool):
+        def on_connect(client, userdata, flags, rc):
+            if rc != 0:
+                self._logger.error(
+                    "Load generator connection refused", client_id=client_id,
+                    rc=rc
+                )
+                return
+            if subscribe:
+                client.subscribe(
+                    "{}/#".format(LOADGEN_TOPIC_PREFIX), qos=self._qos
+                )
+            self._connected.add(client_id)
+        return on_connect
+
+    def _make_on_publish(self, index: int):
+        def on_publish(client, userdata, mid):
+            self._acked[index] += 1
+        return on_publish
+
+    def _make_on_message(self, index: int):
+        def on_message(client, userdata, msg):
+            self._received[index] += 1
+        return on_message
+
+    def _wait_connected(self) -> bool:
+        """
+        This function waits until every connection is up
+        :return: True if all the connections are up
+        """
+        expected = len(self._publishers) + len(self._subscribers)
+        deadline = time.monotonic() + _CONNECT_TIMEOUT
+        while len(self._connected) < expected:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+
+        # give the subscriptions time to be acknowledged
+        time.sleep(0.5)
+        return True
+
+    def run(
+            self, duration: float=LOADGEN_DURATION,
+            report_interval: float=LOADGEN_REPORT_INTERVAL
+    ) -> dict:
+        """
+        This function publishes at the target rate for the given duration
+        :param duration: run time in seconds
+        :param report_interval: seconds between two progress reports
+        :return: the totals of the run
+        """
+        if not self._wait_connected():
+            self._logger.error(
+                "Load generator could not connect all clients",
+                connected=len(self._connected)
+            )
+            self.stop()
+            return {}
+
+        self._logger.info(
+            "Load generator started", rate=self._rate,
+            publishers=len(self._publishers),
+            subscribers=len(self._subscribers), topics=len(self._topics),
+            payload_size=len(self._payload), qos=self._qos
+        )
+
+        publishers = self._publishers
+        topics = self._topics
+        payload = self._payload
+        qos = self._qos
+
+        sent = 0
+        reported = (0, 0, 0)
+        start = time.monotonic()
+        report_at = start + report_interval
+        end = start + duration
+
+        while True:
+            now = time.monotonic()
+            if now >= end:
+                break
+
+            # publish everything due by now, sleep when ahead of schedule
+            due = int((now - start) * self._rate)
+            while sent < due:
+                publishers[sent % len(publishers)].publish(
+                    topics[sent % len(topics)], payload, qos=qos
+                )
+                sent += 1
+
+            if now >= report_at:
+                reported = self._report(
+                    sent, reported, now - report_at + report_interval
+                )
+                report_at = now + report_interval
+
+            time.sleep(max(min(
+                (sent + 1) / self._rate - (now - start), report_at - now,
+                end - now
+            ), 0.0))
+
+        elapsed = time.monotonic() - start
+        # let the last messages arrive
+        time.sleep(1.0)
+        totals = {
+            "sent": sent,
+            "acked": sum(self._acked),
+            "received": sum(self._received),
+            "elapsed": elapsed,
+            "sent_rate": sent / elapsed,
+            "delivery_ratio": (
+                sum(self._received) / (sent * len(self._subscribers))
+                if sent and self._subscribers else None
+            ),
+        }
+        self._logger.info("Load generator finished", **totals)
+        self.stop()
+        return totals
+
+    def _report(self, sent: int, previous: tuple, elapsed: float) -> tuple:
+        """
+        This function logs and sends the rates since the last report
+        :param sent: total publishes so far
+        :param previous: totals of (sent, acked, received) at the last report
+        :param elapsed: seconds since the last report
+        :return: the current totals
+        """
+        current = (sent, sum(self._acked), sum(self._received))
+        sent_rate, acked_rate, received_rate = (
+            (value - last) / elapsed for value, last in zip(current, previous)
+        )
+
+        self._logger.info(
+            "Load generator progress", sent_rate=sent_rate,
+            acked_rate=acked_rate, received_rate=received_rate
+        )
+        prefix = "{}.loadgen.".format(STATSD_PREFIX)
+        self._sink.gauges((
+            (prefix + "sent_rate", sent_rate),
+            (prefix + "acked_rate", acked_rate),
+            (prefix + "received_rate", received_rate),
+        ))
+        return current
+
+    def stop(self) -> None:
+        """
+        This function disconnects every connection
+        :return: None
+        """
+        for client in self._publishers + self._subscribers:
+            client.disconnect()
+            client.loop_stop()
@@ -4,13 +4,68 @@ This file implements the local broker client object
 """
 
 import logging.config
-from statsd import StatsClient
+import threading
+import time
+from array import array
 
 import paho.mqtt.client as mqtt
 from config import logging_config
 import structlog
-from config.mqtt_config import LOCAL_MQTT_PORT, LOCAL_MQTT_ADDRESS
-from config.statsd_config import STATSD_PORT, STATSD_ADDRESS
+from config.anomaly_config import ANOMALY_DETECTION_ENABLED
+from config.churn_config import (
+    CHURN_TRACKING_ENABLED, CHURN_LOG_TOPIC, CHURN_WINDOW
+)
+from config.aggregation_config import AGGREGATION_ENABLED, AGGREGATION_WINDOW
+from config.flight_recorder_config import FLIGHT_RECORDER_ENABLED
+from config.forecast_config import FORECAST_ENABLED
+from config.ha_config import HA_ENABLED
+from config.health_config import WATCHDOG_ENABLED
+from config.log_tailer_config import LOG_TAILER_ENABLED
+from config.mqtt_config import (
+    LOCAL_MQTT_TLS_ENABLED, LOCAL_MQTT_V5_ENABLED,
+    LOCAL_MQTT_V5_PROBE_ATTEMPTS, LOCAL_MQTT_V5_PROBE_RETRY,
+    LOCAL_MQTT_REPORT_INTERVAL
+)
+from config.profiling_config import PROFILING_ENABLED
+from config.queue_config import QUEUE_ENABLED, QUEUE_REPORT_INTERVAL
+from config.republish_config import REPUBLISH_ENABLED
+from config.retained_config import RETAINED_SCAN_ENABLED
+from config.process_config import PROCESS_MONITOR_ENABLED, PROCESS_INTERVAL
+from config.scheduler_config import FLUSH_SCHEDULER_ENABLED
+from config.schema_config import (
+    SCHEMA_PROFILES_ENABLED, SCHEMA_VERSION_TIMEOUT
+)
+from config.shared_table_config import SHARED_TABLE_ENABLED
+from config.staleness_config import STALENESS_ENABLED, STALE_TICK
+from config.statsd_config import STATSD_PREFIX
+from local_mqtt_client.anomaly_detector import AnomalyDetector
+from local_mqtt_client.capacity_forecaster import CapacityForecaster
+from local_mqtt_client.churn_tracker import ChurnTracker
+from local_mqtt_client.connection import connect_client
+from local_mqtt_client.flight_recorder import FlightRecorder
+from local_mqtt_client.message_queue import MessageQueue
+from local_mqtt_client.flush_scheduler import FlushScheduler
+from local_mqtt_client.health_server import HealthServer
+from local_mqtt_client.leader_election import LeaderElection
+from local_mqtt_client.log_tailer import MosquittoLogTailer
+from local_mqtt_client.metered_client import (
+    MQTTV5_AVAILABLE, MeteredClient, connect_properties, probe_mqtt5,
+    subscription_properties
+)
+from local_mqtt_client.metric_registry import MetricRegistry
+from local_mqtt_client.metric_sink import MetricSink
+from local_mqtt_client.process_monitor import ProcessMonitor
+from local_mqtt_client.profiler import Profiler
+from local_mqtt_client.retained_scanner import RetainedScanner
+from local_mqtt_client.shared_table import SharedMetricTable
+from local_mqtt_client.staleness import StalenessTracker
+from local_mqtt_client.state_publisher import StatePublisher
+from local_mqtt_client.sys_schema import (
+    SchemaProfiles, VERSION_TOPIC, parse_version
+)
+from local_mqtt_client.tls import create_tls_context
+from local_mqtt_client.watchdog import Watchdog
+from local_mqtt_client.window_aggregator import WindowAggregator
 
 
 class LocalMQTTClient:
@@ -18,214 +73,331 @@ class LocalMQTTClient:
     This class connects to the local broker and interacts with it as needed
     """
     def __init__(
-            self, username: str=None, password: str=None
+            self, username: str=None, password: str=None,
+            anomaly_detection: bool=ANOMALY_DETECTION_ENABLED,
+            aggregation: bool=AGGREGATION_ENABLED,
+            watchdog: bool=WATCHDOG_ENABLED,
+            log_tailer: bool=LOG_TAILER_ENABLED,
+            process_monitor: bool=PROCESS_MONITOR_ENABLED,
+            churn_tracking: bool=CHURN_TRACKING_ENABLED,
+            flush_scheduler: bool=FLUSH_SCHEDULER_ENABLED,
+            tls: bool=LOCAL_MQTT_TLS_ENABLED,
+            flight_recorder: bool=FLIGHT_RECORDER_ENABLED,
+            profiling: bool=PROFILING_ENABLED,
+            queue: bool=QUEUE_ENABLED,
+            retained_scan: bool=RETAINED_SCAN_ENABLED,
+            forecast: bool=FORECAST_ENABLED,
+            schema_profiles: bool=SCHEMA_PROFILES_ENABLED,
+            leader_election: bool=HA_ENABLED,
+            republish: bool=REPUBLISH_ENABLED,
+            shared_table: bool=SHARED_TABLE_ENABLED,
+            staleness: bool=STALENESS_ENABLED,
+            mqtt5: bool=LOCAL_MQTT_V5_ENABLED
     ):
         logging.config.dictConfig(logging_config.get_logging_conf())
         self._logger = structlog.getLogger(__name__)
         self._logger.addHandler(logging.NullHandler())
 
+        # the tls context outlives the connections so the session can be
+        # resumed on reconnect
+        self._tls_context = None
+        if tls is True:
+            self._tls_context = create_tls_context()
+
+        # optional MQTT v5 with topic aliases and subscription identifiers,
+        # 3.1.1 when the broker or paho does not speak it
+        self._username = str(username)
+        self._password = str(password)
+        self._mqtt5 = False
+        self._mqtt5_probe_pending = False
+        if mqtt5 is True:
+            if not MQTTV5_AVAILABLE:
+                self._logger.warning(
+                    "paho-mqtt does not support MQTT v5, using 3.1.1"
+                )
+            else:
+                self._mqtt5 = self._probe_mqtt5()
+                for _ in range(LOCAL_MQTT_V5_PROBE_ATTEMPTS - 1):
+                    if self._mqtt5 is not None:
+                        break
+                    time.sleep(LOCAL_MQTT_V5_PROBE_RETRY)
+                    self._mqtt5 = self._probe_mqtt5()
+
+                if self._mqtt5 is None:
+                    # a broker down or starting is probed again once the
+                    # 3.1.1 connection is made
+                    self._logger.warning(
+                        "Broker not reachable for the MQTT v5 probe, using "
+                        "3.1.1 until it is probed again"
+                    )
+                    self._mqtt5 = False
+                    self._mqtt5_probe_pending = True
+                elif not self._mqtt5:
+                    self._logger.warning(
+                        "Broker did not accept MQTT v5, using 3.1.1"
+                    )
+
         # we are now using a retain session to get all missed messages in
         # case we disconnect
-        self._client = mqtt.Client(
-            clean_session=True, userdata=None,
-            protocol=mqtt.MQTTv311
-        )
+        if self._mqtt5:
+            self._client = MeteredClient(
+                userdata=None, protocol=mqtt.MQTTv5
+            )
+        else:
+            self._client = MeteredClient(
+                clean_session=True, userdata=None,
+                protocol=mqtt.MQTTv311
+            )
+        self._protocol_report_at = (
+            time.monotonic() + LOCAL_MQTT_REPORT_INTERVAL
+        )
+        self._received_messages = 0
+        self._received_bytes = 0
+        self._aliased_messages = 0
+
+        # optional handler timing and on demand profiling, started on
+        # SIGUSR2 or from the health endpoint
+        self._profiler = None
+        if profiling is True:
+            self._profiler = Profiler()
+            self._profiler.install_signal_handler()
+
+        self._client.on_connect = self._timed("on_connect", self._on_connect)
+        self._client.on_disconnect = self._timed(
+            "on_disconnect", self._on_disconnect
+        )
+        self._client.on_message = self._timed("on_message", self.on_message)
+
+        # every $SYS metric gets an id and a slot in the shared state store,
+        # the lock guards it against the threads flushing it
+        self._registry = MetricRegistry()
+        self._state_lock = threading.Lock()
+
+        # optional copy of the latest values in shared memory for the local
+        # agents, written under the state lock
+        self._shared_table = None
+        if shared_table is True:
+            self._shared_table = SharedMetricTable(
+                [descriptor.name for descriptor in self._registry.descriptors]
+            )
 
-        self._client.on_connect = self._on_connect
-        self._client.on_disconnect = self._on_disconnect
-        self._client.on_message = self.on_message
+        # optional ring of the last messages replacing the per message log,
+        # dumped on SIGUSR1 or when a handler raises
+        self._flight_recorder = None
+        if flight_recorder is True:
+            self._flight_recorder = FlightRecorder()
+            self._flight_recorder.install_signal_handler()
+
+        # optional reconnect loop detection from the broker log topic
+        self._churn_tracker = None
+        self._churn_window_start = time.monotonic()
+        self._churn_lock = threading.Lock()
+        if churn_tracking is True:
+            self._churn_tracker = ChurnTracker()
+
+        # optional selection of the $SYS topics published by the version of
+        # the broker, every known topic is routed until one is selected
+        self._schema_profiles = None
+        self._schema = None
+        self._schema_subscribed = False
+        self._schema_timer = None
+        self._schema_lock = threading.Lock()
+        if schema_profiles is True:
+            self._schema_profiles = SchemaProfiles(self._registry)
 
         self._set_message_callbacks()
 
+        # optional loop lag watchdog, reported on the health endpoint
+        self._watchdog = None
+        self._health_server = None
+        if watchdog is True:
+            self._watchdog = Watchdog(self._client, self._registry)
+            self._health_server = HealthServer(
+                self._watchdog, self._profiler
+            )
+            self._watchdog.start()
+            self._health_server.start()
+
         self._client.username_pw_set(
-            username=str(username), password=str(password)
+            username=self._username, password=self._password
         )
 
         # run the connect function
         self._connect()
-        self._stats_client = StatsClient(host=STATSD_ADDRESS, port=STATSD_PORT)
+        self._sink = MetricSink()
+
+        # optional active/standby mode, only the elected collector sends
+        self._leader_election = None
+        if leader_election is True:
+            self._leader_election = LeaderElection(self._client, self._sink)
+            self._leader_election.start()
+
+        # optional copy of everything sent, published back to the broker as
+        # one retained document
+        self._state_publisher = None
+        if republish is True:
+            self._state_publisher = StatePublisher(self._client, self._sink)
+            self._sink.add_observer(self._state_publisher.observe)
+            if self._leader_election is not None:
+                self._leader_election.add_observer(
+                    self._state_publisher.on_role_change
+                )
+
+        # optional analysis stage run on every parsed metric
+        self._anomaly_detector = None
+        if anomaly_detection is True:
+            self._anomaly_detector = AnomalyDetector(self._registry)
+
+        # optional time to exhaustion of the metrics running into a limit
+        self._forecaster = None
+        if forecast is True:
+            self._forecaster = CapacityForecaster(self._registry)
+
+        # optional deadline per metric from its learned update period,
+        # updated and checked under the state lock
+        self._staleness = None
+        if staleness is True:
+            self._staleness = StalenessTracker(
+                self._registry, time.monotonic()
+            )
+
+        # optional min/max/avg windows so short bursts survive until netdata
+        # collects the chart
+        self._window_aggregator = None
+        self._window_end = time.monotonic() + AGGREGATION_WINDOW
+        if aggregation is True:
+            self._window_aggregator = WindowAggregator(len(self._registry))
+
+        # optional second input, connection events from the broker log
+        self._log_tailer = None
+        if log_tailer is True:
+            self._log_tailer = MosquittoLogTailer(self._sink)
+            self._log_tailer.start()
+
+        # optional resource usage of the broker process, sampled along with
+        # the $SYS messages
+        self._process_monitor = None
+        self._process_sample_at = 0.0
+        if process_monitor is True:
+            self._process_monitor = ProcessMonitor()
+
+        # optional clock aligned flush, values are buffered in the registry
+        # and sent once per netdata tick instead of on arrival
+        self._flush_scheduler = None
+        self._flushed_updates = array('L', [0]) * len(self._registry)
+        self._pending = dict()
+        if flush_scheduler is True:
+            self._flush_scheduler = FlushScheduler(self._flush)
+            self._flush_scheduler.start()
+
+        # without the scheduler the staleness deadlines get a timer of their
+        # own, they must expire while no message comes
+        self._stale_timer = None
+        if self._staleness is not None and self._flush_scheduler is None:
+            self._stale_timer = FlushScheduler(
+                self._stale_tick, interval=STALE_TICK
+            )
+            self._stale_timer.start()
+
+        # optional worker stage, the network loop only queues the $SYS
+        # metric messages and the worker parses and sends them
+        self._queue = None
+        self._queue_report_at = time.monotonic() + QUEUE_REPORT_INTERVAL
+        if queue is True:
+            self._queue = MessageQueue(self._timed(
+                "sys_metric_worker", self._handle_sys_metric, loop=False
+            ))
+            self._queue.start()
+
+        # optional periodic inventory of the retained messages, done on a
+        # connection of its own
+        self._retained_scanner = None
+        if retained_scan is True:
+            self._retained_scanner = RetainedScanner(
+                self._sink, username, password, self._tls_context
+            )
+            self._retained_scanner.start()
         self._logger.info("Local MQTT Client init called")
 
-    def _set_message_callbacks(self):
+    def _set_message_callbacks(self) -> None:
         """
-
-        :return:
+        This function routes every registered $SYS topic to the metric
+        handler, or only the broker version when the topics are picked by
+        the schema profile of the version. With MQTT v5 the metric messages
+        are routed by their subscription identifier instead
+        :return: None
         """
-        self._client.message_callback_add(
-            "$SYS/broker/bytes/received", self.on_bytes_received
-        )
+        self._on_sys_metric_timed = self._timed(
+            "sys_metric", self._on_sys_metric
+        )
+        if self._schema_profiles is None:
+            if not self._mqtt5:
+                for descriptor in self._registry.descriptors:
+                    self._client.message_callback_add(
+                        descriptor.topic, self._on_sys_metric_timed
+                    )
+        else:
+            self._client.message_callback_add(
+                VERSION_TOPIC,
+                self._timed("broker_version", self._on_broker_version)
+            )
 
-        self._client.message_callback_add(
-            "$SYS/broker/bytes/sent", self.on_bytes_sent
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/clients/connected", self.on_clients_connected
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/clients/expired", self.on_clients_expired
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/clients/disconnected", self.on_clients_disconnected
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/clients/maximum", self.on_clients_maximum
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/clients/total", self.on_clients_total
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/heap/current", self.on_heap_current_size
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/heap/maximum", self.on_heap_maximum_size
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/connections/1min", self.on_connections_1min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/connections/5min", self.on_connections_5min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/connections/15min", self.on_connections_15min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/bytes/received/1min", self.on_bytes_received_1min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/bytes/received/5min", self.on_bytes_received_5min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/bytes/received/15min",
-            self.on_bytes_received_15min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/bytes/sent/1min", self.on_bytes_sent_1min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/bytes/sent/5min", self.on_bytes_sent_5min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/bytes/sent/15min", self.on_bytes_sent_15min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/messages/received/1min",
-            self.on_messages_received_1min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/messages/received/5min",
-            self.on_messages_received_5min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/messages/received/15min",
-            self.on_messages_received_15min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/messages/sent/1min", self.on_messages_sent_1min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/messages/sent/5min", self.on_messages_sent_5min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/messages/sent/15min", self.on_messages_sent_15min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/publish/dropped/1min",
-            self.on_publish_dropped_1min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/publish/dropped/5min",
-            self.on_publish_dropped_5min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/publish/dropped/15min",
-            self.on_publish_dropped_15min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/publish/received/1min",
-            self.on_publish_received_1min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/publish/received/5min",
-            self.on_publish_received_5min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/publish/received/15min",
-            self.on_publish_received_15min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/publish/sent/1min", self.on_publish_sent_1min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/publish/sent/5min", self.on_publish_sent_5min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/publish/sent/15min", self.on_publish_sent_15min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/sockets/1min", self.on_sockets_1min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/sockets/5min", self.on_sockets_5min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/load/sockets/15min", self.on_sockets_15min
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/messages/inflight", self.on_inflight
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/messages/received", self.on_messages_received
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/messages/sent", self.on_messages_sent
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/messages/stored", self.on_messages_stored
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/publish/messages/dropped", self.on_publish_dropped
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/publish/messages/received", self.on_publish_received
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/publish/messages/sent", self.on_publish_sent
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/retained messages/count", self.on_retain_messages_count
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/subscriptions/count", self.on_subscription_count
-        )
-        self._client.message_callback_add(
-            "$SYS/broker/uptime", self.on_broker_uptime
-        )
+        if self._churn_tracker is not None:
+            self._client.message_callback_add(
+                CHURN_LOG_TOPIC, self._timed("broker_log", self._on_broker_log)
+            )
+
+    def _timed(self, name: str, handler, loop: bool=True):
+        """
+        This function returns the handler timed by the profiler, or the
+        handler itself when profiling is off
+        :param name: the name of the handler in the profiling report
+        :param handler: the handler function
+        :param loop: True if the handler runs in the network loop thread
+        :return: the handler to register
+        """
+        if self._profiler is None:
+            return handler
+        return self._profiler.wrap(name, handler, loop)
 
     # The callback for when a PUBLISH message is received from the server.
     def on_message(self, client, userdata, msg):
+        if self._mqtt5:
+            # only the metric subscriptions carry an identifier, the metric
+            # id + 1, brokers without identifiers are routed by topic
+            registry = self._registry
+            identifiers = getattr(
+                msg.properties, "SubscriptionIdentifier", None
+            )
+            if identifiers and 0 < identifiers[0] <= len(registry):
+                descriptor = registry.descriptors[identifiers[0] - 1]
+            else:
+                descriptor = registry.by_topic.get(msg.topic)
+            if descriptor is not None:
+                self._on_sys_metric_timed(client, userdata, msg, descriptor)
+                return
         self._logger.info("Received nessage", mqtt_msg=msg)
 
+    def _probe_mqtt5(self):
+        """
+        This function probes the broker for MQTT v5
+        :return: True if it accepts v5, False if it refuses it, None if it
+        could not be reached
+        """
+        return probe_mqtt5(
+            self._logger, self._username, self._password, self._tls_context
+        )
+
     def _connect(self) -> None:
         """
         This function calls the connect function on the client object,
         this will block till there is an ok connection
         :return: None
         """
-        # checking if connection is ok (first we assume connection is not ok)
-        try:
-            self._logger.info(
-                "Attempting to connect to local MQTT server.",
-                server=LOCAL_MQTT_ADDRESS, port=LOCAL_MQTT_PORT, kepalive=60
-            )
-
-            self._client.connect_async(
-                host=LOCAL_MQTT_ADDRESS, port=LOCAL_MQTT_PORT, keepalive=60
-            )
-
-        except Exception as e:
-            # exception was raised during the connect function, we must wait
-            # for ok connection
-            self._logger.error("Unable to connect to MQTT Broker", error=e)
+        connect_client(
+            self._client, self._logger, tls_context=self._tls_context,
+            properties=connect_properties() if self._mqtt5 else None
+        )
 
     def run_loop(
             self, timeout: float=.25, in_thread: bool=False, loop_var: int=1,
@@ -257,727 +429,621 @@ class LocalMQTTClient:
             self._logger.error("Error starting the loop", error=e)
             raise e
 
-    def _on_connect(self, client, userdata, flags, rc):
-        """
-        This function executed on on_connect, Args are left blank because
-        they are predetermined
-        :param client:
-        :param userdata:
-        :param flags:
-        :param rc:
-        :return:
-        """
-        self._logger.info("Connection to local MQTT server made")
-
-        self._subscribe()
-
-    def _subscribe(self) -> None:
+    def stop(self) -> None:
         """
-        This function subscribes to provided topic
+        This function shuts the collector down: a leader releases its lease
+        so a standby takes over right away, the threads are stopped, the
+        client disconnects and the shared table is closed
         :return: None
         """
-        self._logger.info("Subscribing to endpoint", ep="$SYS/#")
-        self._client.subscribe("$SYS/#", qos=1)
-
-    def _on_disconnect(self, client, userdata, rc) -> None:
-        """
-        This function is called on disconnect event
-        :param client: the client object
-        :param userdata: the data set by user on startup
-        :param rc: The return error code
-        :return: None
-        """
-        self._logger.info(
-            "Local MQTT Client has disconnected from the MQTT Server",
-            userdata=userdata, rc=rc, rc_string=mqtt.error_string(rc)
-        )
-
-    def on_bytes_received(self, client, userdata, msg):
-        """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.bytes_received', float(msg.payload)
-        )
-
-    def on_bytes_sent(self, client, userdata, msg) -> None:
-        """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.bytes_sent', float(msg.payload)
-        )
-
-    def on_clients_connected(self, client, userdata, msg) -> None:
-        """
+        self._logger.info("Local MQTT Client stopping")
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.clients_connected', float(msg.payload)
-        )
-
-    def on_clients_expired(self, client, userdata, msg) -> None:
-        """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.clients_expired', float(msg.payload)
-        )
-
-    def on_clients_disconnected(self, client, userdata, msg) -> None:
-        """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.clients_disconnected', float(msg.payload)
-        )
-
-    def on_clients_maximum(self, client, userdata, msg) -> None:
-        """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.clients_maximum', float(msg.payload)
-        )
-
-    def on_clients_total(self, client, userdata, msg) -> None:
-        """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.clients_total', float(msg.payload)
-        )
-
-    def on_heap_current_size(self, client, userdata, msg) -> None:
-        """
+        if self._leader_election is not None:
+            self._leader_election.stop()
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.heap_current', float(msg.payload)
-        )
+        for component in (
+                self._retained_scanner, self._flush_scheduler,
+                self._stale_timer, self._queue, self._log_tailer,
+                self._watchdog, self._health_server
+        ):
+            if component is not None:
+                component.stop()
 
-    def on_heap_maximum_size(self, client, userdata, msg) -> None:
-        """
+        self._client.disconnect()
+        self._client.loop_stop()
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.heap_maximum', float(msg.payload)
-        )
+        # no message is handled anymore, the readers move on to the table
+        # of the next collector
+        if self._shared_table is not None:
+            with self._state_lock:
+                shared_table, self._shared_table = self._shared_table, None
+            shared_table.close()
 
-    def on_connections_1min(self, client, userdata, msg) -> None:
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
         """
-
+        This function executed on on_connect, Args are left blank because
+        they are predetermined
         :param client:
         :param userdata:
-        :param msg:
+        :param flags:
+        :param rc:
+        :param properties: the connack properties, MQTT v5 only
         :return:
         """
         self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.connections_1min', float(msg.payload)
+            "Connection to local MQTT server made",
+            protocol="5" if self._mqtt5 else "3.1.1", properties=properties
         )
 
-    def on_connections_5min(self, client, userdata, msg) -> None:
-        """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.connections_5min', float(msg.payload)
-        )
+        if self._mqtt5_probe_pending:
+            # the broker was not reachable on startup, now it answers
+            mqtt5 = self._probe_mqtt5()
+            if mqtt5 is not None:
+                self._mqtt5_probe_pending = False
+            if mqtt5:
+                self._logger.info("Broker accepts MQTT v5, reconnecting")
+                self._mqtt5 = True
+                self._client.use_mqtt5(connect_properties())
+                return
 
-    def on_connections_15min(self, client, userdata, msg) -> None:
-        """
+        self._subscribe()
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.connections_15min', float(msg.payload)
-        )
+        if self._tls_context is not None:
+            self._report_tls()
 
-    def on_bytes_received_1min(self, client, userdata, msg) -> None:
-        """
+        if self._watchdog is not None:
+            self._watchdog.on_connect()
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.bytes_received_1min', float(msg.payload)
-        )
+        if self._leader_election is not None:
+            self._leader_election.on_connect()
 
-    def on_bytes_received_5min(self, client, userdata, msg) -> None:
+    def _report_tls(self) -> None:
         """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+        This function keeps the tls session for the next reconnect and sends
+        the handshake metrics
+        :return: None
         """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.bytes_received_5min', float(msg.payload)
-        )
+        context = self._tls_context
+        context.remember_session(self._client.socket())
 
-    def on_bytes_received_15min(self, client, userdata, msg) -> None:
-        """
+        if context.last_handshake_duration is None:
+            return
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
+        prefix = "{}.tls.".format(STATSD_PREFIX)
+        self._emit((
+            (prefix + "handshake_duration",
+             context.last_handshake_duration * 1000.0),
+            (prefix + "session_reused", int(context.last_session_reused)),
+            (prefix + "handshakes", context.handshakes),
+            (prefix + "resumed_handshakes", context.resumed_handshakes),
+        ))
         self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.bytes_received_15min', float(msg.payload)
+            "TLS handshake done",
+            duration=context.last_handshake_duration,
+            session_reused=context.last_session_reused
         )
 
-    def on_bytes_sent_1min(self, client, userdata, msg) -> None:
+    def _subscribe(self) -> None:
         """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+        This function subscribes to provided topic
+        :return: None
         """
+        if self._schema_profiles is None:
+            if self._mqtt5:
+                self._subscribe_metrics(self._registry.descriptors)
+                # $SYS/# brought the broker log along with 3.1.1
+                if self._churn_tracker is not None:
+                    self._client.subscribe([(CHURN_LOG_TOPIC, 1)])
+                return
+            self._logger.info("Subscribing to endpoint", ep="$SYS/#")
+            self._client.subscribe("$SYS/#", qos=1)
+            return
+
+        # the metric topics are subscribed to once the version is known,
+        # the version message is retained so it comes right away
+        topics = [(VERSION_TOPIC, 1)]
+        if self._churn_tracker is not None:
+            topics.append((CHURN_LOG_TOPIC, 1))
         self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.bytes_sent_1min', float(msg.payload)
+            "Subscribing to endpoint", ep=[topic for topic, _ in topics]
         )
+        self._client.subscribe(topics)
 
-    def on_bytes_sent_5min(self, client, userdata, msg) -> None:
-        """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.bytes_sent_5min', float(msg.payload)
-        )
+        # a clean session lost the metric subscriptions
+        with self._schema_lock:
+            self._schema_subscribed = False
+            if self._schema_timer is not None:
+                self._schema_timer.cancel()
+            self._schema_timer = threading.Timer(
+                SCHEMA_VERSION_TIMEOUT, self._apply_schema, args=(None,)
+            )
+            self._schema_timer.daemon = True
+            self._schema_timer.start()
 
-    def on_bytes_sent_15min(self, client, userdata, msg) -> None:
+    def _subscribe_metrics(self, descriptors) -> None:
         """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+        This function subscribes to the topics of the metrics, with MQTT v5
+        each one gets its metric id + 1 as subscription identifier, which
+        takes one subscribe packet per topic
+        :param descriptors: the descriptors of the metrics
+        :return: None
         """
         self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
+            "Subscribing to endpoint",
+            ep=[descriptor.topic for descriptor in descriptors]
         )
-        self._stats_client.gauge(
-            'mosquito_monitor.bytes_sent_15min', float(msg.payload)
-        )
-
-    def on_messages_received_1min(self, client, userdata, msg) -> None:
-        """
+        if not self._mqtt5:
+            self._client.subscribe(
+                [(descriptor.topic, 1) for descriptor in descriptors]
+            )
+            return
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.messages_received_1min', float(msg.payload)
-        )
+        for descriptor in descriptors:
+            self._client.subscribe(
+                descriptor.topic, qos=1, properties=subscription_properties(
+                    descriptor.metric_id + 1
+                )
+            )
 
-    def on_messages_received_5min(self, client, userdata, msg) -> None:
+    def _on_broker_version(self, client, userdata, msg) -> None:
         """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+        This function selects the schema profile of the broker version
+        :param client: the client object
+        :param userdata: the data set by user on startup
+        :param msg: the received message
+        :return: None
         """
+        version = parse_version(msg.payload)
         self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.messages_received_5min', float(msg.payload)
+            "Broker version received", payload=msg.payload, version=version
         )
+        self._apply_schema(version)
 
-    def on_messages_received_15min(self, client, userdata, msg) -> None:
-        """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+    def _apply_schema(self, version) -> None:
         """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.messages_received_15min', float(msg.payload)
-        )
-
-    def on_messages_sent_1min(self, client, userdata, msg) -> None:
+        This function subscribes to the metrics of the profile of the broker
+        version and routes them to the metric handler, the topics of the
+        previous profile which are not in the new one are dropped
+        :param version: the broker version tuple, None if it is not known
+        :return: None
         """
+        with self._schema_lock:
+            if self._schema_timer is not None:
+                self._schema_timer.cancel()
+                self._schema_timer = None
+            profile = self._schema_profiles.select(version)
+            previous = self._schema
+            subscribed = self._schema_subscribed
+            if previous is profile and subscribed:
+                return
+            self._schema = profile
+            self._schema_subscribed = True
+
+        if previous is not None:
+            dropped = [
+                descriptor.topic for descriptor in previous.descriptors
+                if descriptor not in profile.descriptors
+            ]
+            if not self._mqtt5:
+                for topic in dropped:
+                    self._client.message_callback_remove(topic)
+            if dropped and subscribed:
+                self._client.unsubscribe(dropped)
+
+        if not self._mqtt5:
+            for descriptor in profile.descriptors:
+                self._client.message_callback_add(
+                    descriptor.topic, self._on_sys_metric_timed
+                )
+        self._subscribe_metrics(profile.descriptors)
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
         self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.messages_sent_1min', float(msg.payload)
-        )
-
-    def on_messages_sent_5min(self, client, userdata, msg) -> None:
+            "Schema profile selected", profile=profile.name,
+            subscribed=len(profile.descriptors),
+            unsupported=[d.name for d in profile.unsupported],
+            build_dependent=[d.name for d in profile.optional]
+        )
+        prefix = "{}.schema.".format(STATSD_PREFIX)
+        self._emit((
+            (prefix + "subscribed", len(profile.descriptors)),
+            (prefix + "unsupported", len(profile.unsupported)),
+        ))
+
+    def _on_disconnect(
+            self, client, userdata, rc, properties=None
+    ) -> None:
         """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+        This function is called on disconnect event
+        :param client: the client object
+        :param userdata: the data set by user on startup
+        :param rc: The return error code
+        :param properties: the disconnect properties, MQTT v5 only
+        :return: None
         """
         self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.messages_sent_5min', float(msg.payload)
+            "Local MQTT Client has disconnected from the MQTT Server",
+            userdata=userdata, rc=rc, rc_string=mqtt.error_string(rc)
         )
 
-    def on_messages_sent_15min(self, client, userdata, msg) -> None:
-        """
+        if self._watchdog is not None:
+            self._watchdog.on_disconnect()
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.messages_sent_15min', float(msg.payload)
-        )
+        if self._leader_election is not None:
+            self._leader_election.on_disconnect()
 
-    def on_publish_dropped_1min(self, client, userdata, msg) -> None:
+    def _on_sys_metric(
+            self, client, userdata, msg, descriptor=None
+    ) -> None:
         """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+        This function receives every registered $SYS metric message, it is
+        handled right away or queued for the worker
+        :param client: the client object
+        :param userdata: the data set by user on startup
+        :param msg: the received message
+        :param descriptor: the descriptor of the metric, looked up from the
+        topic when None
+        :return: None
         """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.publish_dropped_1min', float(msg.payload)
-        )
+        if descriptor is None:
+            descriptor = self._registry.by_topic[msg.topic]
 
-    def on_publish_dropped_5min(self, client, userdata, msg) -> None:
-        """
+        if self._queue is not None:
+            self._queue.put(descriptor, msg.payload, time.time())
+            return
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.publish_dropped_5min', float(msg.payload)
-        )
+        self._handle_sys_metric(descriptor, msg.payload, time.time())
 
-    def on_publish_dropped_15min(self, client, userdata, msg) -> None:
+    def _handle_sys_metric(
+            self, descriptor, payload: bytes, received_at: float
+    ) -> None:
         """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+        This function handles a $SYS metric message
+        :param descriptor: the descriptor of the metric
+        :param payload: the message payload
+        :param received_at: the wall clock receive time
+        :return: None
         """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.publish_dropped_15min', float(msg.payload)
-        )
+        topic = descriptor.topic
+        if self._watchdog is not None:
+            self._watchdog.handler_started()
 
-    def on_publish_received_1min(self, client, userdata, msg) -> None:
-        """
+        started = time.perf_counter()
+        failed = False
+        try:
+            if self._flight_recorder is None:
+                self._logger.info(
+                    "Received SYS message", topic=topic, payload=payload
+                )
+            self._record(descriptor, descriptor.parser(payload), received_at)
+        except Exception as e:
+            # a bad payload must not take the paho loop down with it
+            failed = True
+            self._logger.error(
+                "Error handling SYS message", topic=topic, payload=payload,
+                error=e
+            )
+        finally:
+            if self._watchdog is not None:
+                self._watchdog.handler_finished(failed)
+
+        if self._flight_recorder is not None:
+            self._flight_recorder.record(
+                topic, payload, received_at, time.perf_counter() - started,
+                failed
+            )
+            if failed:
+                self._flight_recorder.dump_on_failure()
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+    def _on_broker_log(self, client, userdata, msg) -> None:
         """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.publish_received_1min', float(msg.payload)
-        )
-
-    def on_publish_received_5min(self, client, userdata, msg) -> None:
+        This function feeds the broker log messages to the churn tracker
+        :param client: the client object
+        :param userdata: the data set by user on startup
+        :param msg: the received message
+        :return: None
         """
+        with self._churn_lock:
+            self._churn_tracker.add_log_line(msg.payload)
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.publish_received_5min', float(msg.payload)
-        )
+        samples = self._churn_samples(time.monotonic())
+        if samples:
+            self._emit(samples)
 
-    def on_publish_received_15min(self, client, userdata, msg) -> None:
+    def _churn_samples(self, now: float) -> list:
         """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+        This function closes the churn window once it is over, also called
+        from the periodic samples so the rates drop to zero when the log
+        goes quiet
+        :param now: the monotonic time
+        :return: list of (metric name, value), empty while the window runs
         """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.publish_received_15min', float(msg.payload)
-        )
+        with self._churn_lock:
+            elapsed = now - self._churn_window_start
+            if elapsed < CHURN_WINDOW:
+                return []
 
-    def on_publish_sent_1min(self, client, userdata, msg) -> None:
-        """
+            self._churn_window_start = now
+            samples, offenders = self._churn_tracker.flush(elapsed)
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.publish_sent_1min', float(msg.payload)
-        )
+        if offenders:
+            self._logger.warning(
+                "Clients in a reconnect loop", offenders=offenders,
+                window=elapsed
+            )
+        return samples
 
-    def on_publish_sent_5min(self, client, userdata, msg) -> None:
+    def _record(
+            self, descriptor, value: float, received_at: float=None
+    ) -> None:
         """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+        This function stores the parsed metric, sends it to statsd and runs
+        the analysis stages on it
+        :param descriptor: the descriptor of the metric
+        :param value: the parsed value
+        :param received_at: the wall clock receive time, defaults to now
+        :return: None
         """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.publish_sent_5min', float(msg.payload)
-        )
-
-    def on_publish_sent_15min(self, client, userdata, msg) -> None:
+        metric_id = descriptor.metric_id
+        fresh = None
+        closed = None
+        now = time.monotonic()
+        with self._state_lock:
+            self._registry.update(metric_id, value, received_at)
+            if self._staleness is not None:
+                fresh = self._staleness.update(metric_id, now)
+            if self._shared_table is not None:
+                registry = self._registry
+                self._shared_table.update(
+                    metric_id, value, registry.timestamp[metric_id],
+                    registry.updates[metric_id]
+                )
+            if self._window_aggregator is not None:
+                # a sample past the end of the window belongs to the next
+                closed = self._close_window(now)
+                self._window_aggregator.add(metric_id, value)
+
+        if fresh:
+            self._emit(fresh)
+
+        if closed is not None:
+            self._emit(self._window_samples(closed))
+
+        if self._anomaly_detector is not None:
+            self._detect_anomaly(descriptor, value)
+
+        if self._forecaster is not None:
+            forecast = self._forecaster.update(descriptor.metric_id, value)
+            if forecast is not None:
+                self._emit(forecast)
+
+        if self._flush_scheduler is None:
+            # without the scheduler every value goes out as it arrives and
+            # the periodic samples ride along with the $SYS messages
+            self._sink.gauge(descriptor.name, value)
+            samples = self._periodic_samples(now)
+            if samples:
+                self._sink.gauges(samples)
+            if self._state_publisher is not None:
+                self._state_publisher.maybe_publish(now)
+
+    def _emit(self, samples) -> None:
+        """
+        This function sends derived samples, or buffers them until the next
+        flush when the scheduler runs
+        :param samples: iterable of (metric name, value)
+        :return: None
         """
+        if self._flush_scheduler is None:
+            self._sink.gauges(samples)
+            return
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.publish_sent_15min', float(msg.payload)
-        )
+        with self._state_lock:
+            self._pending.update(samples)
 
-    def on_sockets_1min(self, client, userdata, msg) -> None:
+    def _periodic_samples(self, now: float) -> list:
         """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+        This function returns the samples due at this time: the broker
+        process resources, the received bytes per message, the metrics gone
+        stale, the churn rates and the aggregates of a closed window
+        :param now: the monotonic time
+        :return: list of (metric name, value)
         """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.sockets_1min', float(msg.payload)
-        )
+        samples = list()
 
-    def on_sockets_5min(self, client, userdata, msg) -> None:
-        """
+        if (
+                self._process_monitor is not None and
+                now >= self._process_sample_at
+        ):
+            self._process_sample_at = now + PROCESS_INTERVAL
+            samples.extend(self._process_monitor.sample())
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.sockets_5min', float(msg.payload)
-        )
+        if now >= self._protocol_report_at:
+            self._protocol_report_at = now + LOCAL_MQTT_REPORT_INTERVAL
+            samples.extend(self._protocol_samples())
 
-    def on_sockets_15min(self, client, userdata, msg) -> None:
-        """
+        if self._queue is not None and now >= self._queue_report_at:
+            self._queue_report_at = now + QUEUE_REPORT_INTERVAL
+            samples.extend(self._queue_samples())
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.sockets_15min', float(msg.payload)
-        )
+        if self._staleness is not None:
+            samples.extend(self._stale_samples(now))
 
-    def on_inflight(self, client, userdata, msg) -> None:
-        """
+        if self._churn_tracker is not None:
+            samples.extend(self._churn_samples(now))
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.inflight', float(msg.payload)
-        )
+        if self._window_aggregator is not None and now >= self._window_end:
+            with self._state_lock:
+                closed = self._close_window(now)
+            if closed is not None:
+                samples.extend(self._window_samples(closed))
 
-    def on_messages_received(self, client, userdata, msg) -> None:
-        """
+        return samples
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+    def _stale_samples(self, now: float) -> list:
         """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.messages_received', float(msg.payload)
-        )
-
-    def on_messages_sent(self, client, userdata, msg) -> None:
+        This function advances the staleness deadlines
+        :param now: the monotonic time
+        :return: list of (metric name, value) of the new stale metrics
         """
+        with self._state_lock:
+            stale = self._staleness.advance(now)
+            if stale:
+                stale_names = self._staleness.stale_names()
+        if stale:
+            self._logger.warning(
+                "$SYS topics not updated within their usual period",
+                stale=stale_names
+            )
+        return stale
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+    def _stale_tick(self, timing: dict) -> None:
         """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.messages_sent', float(msg.payload)
-        )
-
-    def on_messages_stored(self, client, userdata, msg) -> None:
+        This function advances the staleness deadlines from the staleness
+        timer, a silent broker sends no message the check could ride along
+        :param timing: the timing of the timer, unused
+        :return: None
         """
-
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+        stale = self._stale_samples(time.monotonic())
+        if stale:
+            self._sink.gauges(stale)
+
+    def _protocol_samples(self) -> list:
+        """
+        This function returns the received PUBLISH packets metrics of the
+        last report interval, bytes_per_message is the wire size of a
+        message including its topic and properties
+        :return: list of (metric name, value)
+        """
+        client = self._client
+        received_messages = client.received_messages
+        received_bytes = client.received_bytes
+        aliased_messages = client.aliased_messages
+        messages = received_messages - self._received_messages
+        size = received_bytes - self._received_bytes
+        aliased = aliased_messages - self._aliased_messages
+        self._received_messages = received_messages
+        self._received_bytes = received_bytes
+        self._aliased_messages = aliased_messages
+
+        prefix = "{}.mqtt.".format(STATSD_PREFIX)
+        samples = [
+            (prefix + "protocol", 5 if self._mqtt5 else 4),
+            (prefix + "messages", messages),
+            (prefix + "aliased_messages", aliased),
+        ]
+        if messages:
+            samples.append((prefix + "bytes_per_message", size / messages))
+        return samples
+
+    def _queue_samples(self) -> list:
+        """
+        This function returns the receive queue metrics of the last report
+        interval
+        :return: list of (metric name, value)
+        """
+        stats = self._queue.stats()
+        prefix = "{}.queue.".format(STATSD_PREFIX)
+        return [
+            (prefix + "depth", stats["depth"]),
+            (prefix + "max_depth", stats["max_depth"]),
+            (prefix + "dropped", stats["dropped"]),
+            (prefix + "coalesced", stats["coalesced"]),
+            (prefix + "max_latency", stats["max_latency"] * 1000.0),
+        ]
+
+    def _close_window(self, now: float):
+        """
+        This function closes the window once its end is reached, it must be
+        called with the state lock held
+        :param now: the monotonic time
+        :return: the aggregates of the closed window, None if it is still
+        open
+        """
+        if now < self._window_end:
+            return None
+        # skip the windows in which nothing was received
+        self._window_end += AGGREGATION_WINDOW * (
+            1 + (now - self._window_end) // AGGREGATION_WINDOW
+        )
+        return self._window_aggregator.flush()
+
+    def _window_samples(self, windows) -> list:
+        """
+        This function returns the aggregates of a closed window as extra
+        dimensions of every metric
+        :param windows: the aggregates returned by the window aggregator
+        :return: list of (metric name, value)
+        """
+        descriptors = self._registry.descriptors
+        samples = list()
+        for metric_id, minimum, maximum, mean, _, count in windows:
+            metric = descriptors[metric_id].name
+            samples.append((metric + ".min", minimum))
+            samples.append((metric + ".max", maximum))
+            samples.append((metric + ".avg", mean))
+            samples.append((metric + ".count", count))
+
+        return samples
+
+    def _flush(self, timing: dict) -> None:
+        """
+        This function is called by the scheduler once per interval, it sends
+        the latest value of every metric updated since the last flush, the
+        buffered derived samples and the periodic samples in one batch
+        :param timing: the scheduler timing (jitter, flush_duration, missed)
+        :return: None
         """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.messages_stored', float(msg.payload)
-        )
+        registry = self._registry
+        flushed = self._flushed_updates
+        samples = list()
 
-    def on_publish_dropped(self, client, userdata, msg) -> None:
-        """
+        with self._state_lock:
+            for descriptor in registry.descriptors:
+                metric_id = descriptor.metric_id
+                updates = registry.updates[metric_id]
+                if updates != flushed[metric_id]:
+                    flushed[metric_id] = updates
+                    samples.append(
+                        (descriptor.name, registry.current[metric_id])
+                    )
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.publish_dropped', float(msg.payload)
-        )
+            samples.extend(self._pending.items())
+            self._pending.clear()
 
-    def on_publish_received(self, client, userdata, msg) -> None:
-        """
+        samples.extend(self._periodic_samples(time.monotonic()))
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.publish_received', float(msg.payload)
+        prefix = "{}.scheduler.".format(STATSD_PREFIX)
+        samples.append((prefix + "jitter", timing["jitter"] * 1000.0))
+        samples.append(
+            (prefix + "flush_duration", timing["flush_duration"] * 1000.0)
         )
+        samples.append((prefix + "missed", timing["missed"]))
 
-    def on_publish_sent(self, client, userdata, msg) -> None:
-        """
+        self._sink.gauges(samples)
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.publish_sent', float(msg.payload)
-        )
-
-    def on_retain_messages_count(self, client, userdata, msg) -> None:
-        """
+        # one document per flush
+        if self._state_publisher is not None:
+            self._state_publisher.publish()
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
+    def _detect_anomaly(self, descriptor, value: float) -> None:
         """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.retain_messages_count', float(msg.payload)
-        )
-
-    def on_subscription_count(self, client, userdata, msg) -> None:
+        This function scores the metric and sends the anomaly score and flag
+        :param descriptor: the descriptor of the metric
+        :param value: the parsed value
+        :return: None
         """
+        result = self._anomaly_detector.update(descriptor.metric_id, value)
+        if result is None:
+            return
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
+        score, flag = result
+        score_name, flag_name = self._anomaly_detector.metric_names(
+            descriptor.metric_id
         )
-        self._stats_client.gauge(
-            'mosquito_monitor.subscription_count', float(msg.payload)
-        )
-
-    def on_broker_uptime(self, client, userdata, msg) -> None:
-        """
+        self._emit(((score_name, score), (flag_name, int(flag))))
 
-        :param client:
-        :param userdata:
-        :param msg:
-        :return:
-        """
-        self._logger.info(
-            "Received SYS message", topic=msg.topic, payload=msg.payload
-        )
-        self._stats_client.gauge(
-            'mosquito_monitor.broker_uptime', float(msg.payload.split(b' ')[0])
-        )
+        if flag:
+            self._logger.warning(
+                "Anomaly detected on broker metric", metric=descriptor.name,
+                value=value, score=score
+            )
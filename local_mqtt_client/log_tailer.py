@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the tailer turning the mosquitto log into connection
+event rates
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging.config
+import os
+import os.path as osp
+import select
+import threading
+import time
+
+import structlog
+
+from config import logging_config
+from config.log_tailer_config import (
+    MOSQUITTO_LOG_PATH, LOG_TAILER_INTERVAL, LOG_TAILER_READ_SIZE
+)
+from config.statsd_config import STATSD_PREFIX
+from local_mqtt_client.mosquitto_log import EVENTS, parse_log_line
+
+_IN_MODIFY = 0x00000002
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+
+
+class _DirectoryWatch:
+    """
+    This class wraps an inotify watch on a directory, it only tells that
+    something changed, the tailer then checks the file itself
+    """
+    def __init__(self, path: str):
+        """
+        :param path: the directory to watch
+        """
+        self.fd = None
+
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            return
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            return
+
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return
+
+        mask = (
+            _IN_MODIFY | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE |
+            _IN_DELETE
+        )
+        if libc.inotify_add_watch(fd, path.encode(), mask) < 0:
+            os.close(fd)
+            return
+
+        self.fd = fd
+
+    def wait(self, timeout: float) -> None:
+        """
+        This function blocks until something changed in the directory or the
+        timeout expired, without inotify it just sleeps
+        :param timeout: the maximum time to wait in seconds
+        :return: None
+        """
+        if self.fd is None:
+            time.sleep(timeout)
+            return
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # the events themselves are not needed, drain them
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class MosquittoLogTailer:
+    """
+    This class follows the mosquitto log file from a thread, reading only the
+    bytes appended since the last read. It survives rotation (rename and
+    create, or copytruncate) and sends per second rates of connects,
+    disconnects, keepalive timeouts and auth failures.
+    """
+    def __init__(
+            self, sink, path: str=MOSQUITTO_LOG_PATH,
+            interval: float=LOG_TAILER_INTERVAL,
+            read_size: int=LOG_TAILER_READ_SIZE
+    ):
+        """
+        :param sink: the metric sink the rates are sent to
+        :param path: the mosquitto log file
+        :param interval: seconds between two rate updates
+        :param read_size: maximum bytes read in one go
+        """
+        logging.config.dictConfig(logging_config.get_logging_conf())
+        self._logger = structlog.getLogger(__name__)
+        self._logger.addHandler(logging.NullHandler())
+
+        self._sink = sink
+        self._path = path
+        self._interval = interval
+        self._read_size = read_size
+
+        self._fd = None
+        self._inode = None
+        self._offset = 0
+        self._partial = b""
+        self._counts = dict.fromkeys(EVENTS, 0)
+        self._metric_names = {
+            event: "{}.log.{}".format(STATSD_PREFIX, event)
+            for event in EVENTS
+        }
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="log_tailer", daemon=True
+        )
+
+    def start(self) -> None:
+        """
+        This function starts following the log
+        :return: None
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        This function stops following the log
+        :return: None
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def _open(self, at_end: bool) -> None:
+        """
+        This function opens the current log file
+        :param at_end: start from the end of the file, used on startup so
+        the history is not counted as new events
+        :return: None
+        """
+        try:
+            fd = os.open(self._path, os.O_RDONLY | os.O_CLOEXEC)
+        except FileNotFoundError:
+            return
+
+        stat = os.fstat(fd)
+        self._fd = fd
+        self._inode = (stat.st_dev, stat.st_ino)
+        self._offset = stat.st_size if at_end else 0
+        self._partial = b""
+
+    def _close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _read_new_bytes(self) -> None:
+        """
+        This function parses everything appended since the last read
+        :return: None
+        """
+        while True:
+            chunk = os.pread(self._fd, self._read_size, self._offset)
+            if not chunk:
+                return
+
+            self._offset += len(chunk)
+            lines = (self._partial + chunk).split(b"\n")
+            self._partial = lines.pop()
+
+            counts = self._counts
+            for line in lines:
+                parsed = parse_log_line(line)
+                if parsed is not None:
+                    counts[parsed[0]] += 1
+
+    def _poll(self) -> None:
+        """
+        This function reads the new bytes and follows rotation
+        :return: None
+        """
+        if self._fd is None:
+            self._open(at_end=False)
+            if self._fd is None:
+                return
+
+        self._read_new_bytes()
+
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            # rotated away and not recreated yet
+            return
+
+        if (stat.st_dev, stat.st_ino) != self._inode:
+            # the old file is fully read, move to the new one
+            self._close()
+            self._open(at_end=False)
+            if self._fd is not None:
+                self._read_new_bytes()
+        elif stat.st_size < self._offset:
+            # truncated in place
+            self._offset = 0
+            self._partial = b""
+            self._read_new_bytes()
+
+    def _send_rates(self, elapsed: float) -> None:
+        """
+        This function sends the event rates and resets the counts
+        :param elapsed: seconds since the last rates were sent
+        :return: None
+        """
+        counts = self._counts
+        self._sink.gauges(
+            (self._metric_names[event], counts[event] / elapsed)
+            for event in EVENTS
+        )
+        self._counts = dict.fromkeys(EVENTS, 0)
+
+    def _run(self) -> None:
+        """
+        This function is the tailer thread loop
+        :return: None
+        """
+        watch = _DirectoryWatch(osp.dirname(osp.abspath(self._path)))
+        if watch.fd is None:
+            self._logger.info(
+                "inotify is not available, polling the log", path=self._path
+            )
+
+        self._open(at_end=True)
+        sent_at = time.monotonic()
+
+        try:
+            while not self._stop.is_set():
+                try:
+                    self._poll()
+                except OSError as e:
+                    self._logger.error(
+                        "Error reading the mosquitto log", path=self._path,
+                        error=e
+                    )
+                    self._close()
+
+                now = time.monotonic()
+                if now - sent_at >= self._interval:
+                    self._send_rates(now - sent_at)
+                    sent_at = now
+
+                watch.wait(max(self._interval - (now - sent_at), 0.0))
+        finally:
+            watch.close()
+            self._close()
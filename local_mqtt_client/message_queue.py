@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the bounded queue between the network loop and the
+metric worker
+"""
+
+import collections
+import logging.config
+import threading
+import time
+
+import structlog
+
+from config import logging_config
+from config.error import ConfigException
+from config.queue_config import QUEUE_SIZE, QUEUE_POLICY
+
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_COALESCE = "coalesce"
+POLICIES = (POLICY_DROP_OLDEST, POLICY_COALESCE)
+
+# seconds the worker sleeps without being woken, only bounds the delay of
+# a stop
+_WAIT_TIMEOUT = 1.0
+
+
+class MessageQueue:
+    """
+    This class takes (key, payload, receive time) from the network loop
+    and hands them to a handler called from a worker thread, so a slow
+    parse or statsd send never delays the socket reads and keepalives. The
+    key identifies the source of the message, the collector queues the
+    metric descriptor. With the drop_oldest policy the messages sit in a
+    deque bounded to the queue size, appending and popping need no lock.
+    With the coalesce policy the queue is a dict of the latest message per
+    key which the worker swaps for an empty one on every drain.
+    """
+    def __init__(
+            self, handler, size: int=QUEUE_SIZE, policy: str=QUEUE_POLICY
+    ):
+        """
+        :param handler: function called with key, payload and receive time
+        :param size: number of messages the queue holds
+        :param policy: the overflow policy, one of POLICIES
+        """
+        if policy not in POLICIES:
+            raise ConfigException("Unknown queue policy {}".format(policy))
+
+        logging.config.dictConfig(logging_config.get_logging_conf())
+        self._logger = structlog.getLogger(__name__)
+        self._logger.addHandler(logging.NullHandler())
+
+        self._handler = handler
+        self._size = size
+        self._coalesce = policy == POLICY_COALESCE
+
+        self._messages = collections.deque(maxlen=size)
+        self._latest = dict()
+        self._lock = threading.Lock()
+
+        # the counters of the current report window, written by the
+        # producer apart from the latency written by the worker
+        self._max_depth = 0
+        self._dropped = 0
+        self._coalesced = 0
+        self._max_latency = 0.0
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="message_queue", daemon=True
+        )
+
+    def __len__(self) -> int:
+        if self._coalesce:
+            return len(self._latest)
+        return len(self._messages)
+
+    def start(self) -> None:
+        """
+        This function starts the worker thread
+        :return: None
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        This function stops the worker thread, the queued messages are lost
+        :return: None
+        """
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join()
+
+    def put(self, key, payload: bytes, received_at: float) -> None:
+        """
+        This function queues a message, called from the network loop
+        :param key: the hashable message source, the messages of one key
+        are coalesced
+        :param payload: the message payload
+        :param received_at: the wall clock receive time
+        :return: None
+        """
+        if self._coalesce:
+            with self._lock:
+                latest = self._latest
+                if key in latest:
+                    self._coalesced += 1
+                elif len(latest) >= self._size:
+                    del latest[next(iter(latest))]
+                    self._dropped += 1
+                latest[key] = (payload, received_at)
+                depth = len(latest)
+        else:
+            messages = self._messages
+            if len(messages) == self._size:
+                self._dropped += 1
+            messages.append((key, payload, received_at))
+            depth = len(messages)
+
+        if depth > self._max_depth:
+            self._max_depth = depth
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        """
+        This function is the worker loop
+        :return: None
+        """
+        while not self._stop.is_set():
+            self._wakeup.wait(_WAIT_TIMEOUT)
+            # cleared before draining, a message put while draining sets it
+            # again and is picked up on the next round
+            self._wakeup.clear()
+            try:
+                self._drain()
+            except Exception as e:
+                self._logger.error("Error handling queued message", error=e)
+
+    def _drain(self) -> None:
+        """
+        This function hands every queued message to the handler
+        :return: None
+        """
+        handler = self._handler
+
+        if self._coalesce:
+            with self._lock:
+                latest = self._latest
+                self._latest = dict()
+            for key, (payload, received_at) in latest.items():
+                self._observe(received_at)
+                handler(key, payload, received_at)
+            return
+
+        messages = self._messages
+        while True:
+            try:
+                key, payload, received_at = messages.popleft()
+            except IndexError:
+                return
+            self._observe(received_at)
+            handler(key, payload, received_at)
+
+    def _observe(self, received_at: float) -> None:
+        latency = time.time() - received_at
+        if latency > self._max_latency:
+            self._max_latency = latency
+
+    def stats(self) -> dict:
+        """
+        This function returns the queue counters of the window since the
+        last call and starts a new window
+        :return: dict of depth, max_depth, dropped, coalesced and
+        max_latency in seconds
+        """
+        depth = len(self)
+        stats = {
+            "depth": depth,
+            "max_depth": max(self._max_depth, depth),
+            "dropped": self._dropped,
+            "coalesced": self._coalesced,
+            "max_latency": self._max_latency,
+        }
+        self._max_depth = depth
+        self._dropped = 0
+        self._coalesced = 0
+        self._max_latency = 0.0
+        return stats
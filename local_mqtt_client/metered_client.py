@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the paho client of the collector and its MQTT v5 setup
+"""
+
+import math
+import time
+
+import paho.mqtt.client as mqtt
+
+from config.mqtt_config import (
+    LOCAL_MQTT_ADDRESS, LOCAL_MQTT_PORT, LOCAL_MQTT_V5_PROBE_TIMEOUT,
+    LOCAL_MQTT_TOPIC_ALIAS_MAXIMUM, LOCAL_MQTT_RECEIVE_MAXIMUM
+)
+
+# paho-mqtt speaks MQTT v5 from 1.5 on
+MQTTV5_AVAILABLE = hasattr(mqtt, "MQTTv5")
+
+if MQTTV5_AVAILABLE:
+    from paho.mqtt.packettypes import PacketTypes
+    from paho.mqtt.properties import Properties
+
+# the connack reason of a broker refusing v5, paho also maps the 3.1.1
+# refusal of the protocol version to it
+_UNSUPPORTED_PROTOCOL_VERSION = 132
+
+# the connack reasons of a broker answering but not taking clients yet,
+# server unavailable and server busy
+_BUSY_REASONS = (136, 137)
+
+
+def _length_size(remaining_length: int) -> int:
+    """
+    This function returns the size of the encoded remaining length of a
+    packet
+    :param remaining_length: the remaining length
+    :return: number of bytes, 1 to 4
+    """
+    size = 1
+    while remaining_length >= 128:
+        remaining_length //= 128
+        size += 1
+    return size
+
+
+def connect_properties(
+        topic_alias_maximum: int=LOCAL_MQTT_TOPIC_ALIAS_MAXIMUM,
+        receive_maximum: int=LOCAL_MQTT_RECEIVE_MAXIMUM
+):
+    """
+    This function returns the MQTT v5 connect properties of the collector
+    :param topic_alias_maximum: topic aliases the broker may set
+    :param receive_maximum: qos 1 and 2 messages the broker may have in
+    flight
+    :return: the paho properties
+    """
+    properties = Properties(PacketTypes.CONNECT)
+    properties.TopicAliasMaximum = topic_alias_maximum
+    properties.ReceiveMaximum = receive_maximum
+    return properties
+
+
+def subscription_properties(identifier: int):
+    """
+    This function returns the MQTT v5 subscribe properties carrying a
+    subscription identifier, the broker sets it on every message matching
+    the subscription
+    :param identifier: the subscription identifier, 1 or more
+    :return: the paho properties
+    """
+    properties = Properties(PacketTypes.SUBSCRIBE)
+    properties.SubscriptionIdentifier = identifier
+    return properties
+
+
+def probe_mqtt5(
+        logger, username: str=None, password: str=None, tls_context=None,
+        host: str=LOCAL_MQTT_ADDRESS, port: int=LOCAL_MQTT_PORT,
+        timeout: float=LOCAL_MQTT_V5_PROBE_TIMEOUT
+):
+    """
+    This function connects once with MQTT v5 to find out if the broker
+    speaks it. A 3.1.1 broker refuses the connection with an unsupported
+    protocol version, closes it or never answers it
+    :param logger: the logger of the caller
+    :param username: the broker username
+    :param password: the broker password
+    :param tls_context: the tls context, None for plain tcp
+    :param host: the broker address
+    :param port: the broker port
+    :param timeout: seconds to wait for the broker answer
+    :return: True if the broker accepted the v5 connection, False if it
+    refused it, None if the broker could not be reached
+    """
+    if not MQTTV5_AVAILABLE:
+        return False
+
+    result = dict()
+
+    def on_connect(client, userdata, flags, reason, properties=None):
+        result["reason"] = reason
+
+    client = mqtt.Client(protocol=mqtt.MQTTv5)
+    client.on_connect = on_connect
+    if username is not None:
+        client.username_pw_set(username=username, password=password)
+    if tls_context is not None:
+        client.tls_set_context(tls_context)
+
+    try:
+        # paho 1.5 bounds the tcp connect by the keepalive, 1.6 by its own
+        # connect timeout
+        client.connect(
+            host, port, keepalive=max(int(math.ceil(timeout)), 1),
+            clean_start=True, properties=connect_properties()
+        )
+    except OSError as e:
+        logger.warning(
+            "MQTT v5 probe could not reach the broker", server=host,
+            port=port, error=e
+        )
+        return None
+
+    # the loop is run by hand, it must not reconnect after a close
+    closed = False
+    deadline = time.monotonic() + timeout
+    while "reason" not in result and time.monotonic() < deadline:
+        if client.loop(timeout=0.1) != mqtt.MQTT_ERR_SUCCESS:
+            closed = True
+            break
+    client.disconnect()
+
+    reason = result.get("reason")
+    logger.info(
+        "MQTT v5 probe done", answered=reason is not None, closed=closed,
+        reason=str(reason)
+    )
+    if reason is None:
+        # closed or left unanswered right after the connect
+        return False
+    if reason in _BUSY_REASONS:
+        return None
+    # any other reason code comes from a broker parsing v5
+    return reason != _UNSUPPORTED_PROTOCOL_VERSION
+
+
+class MeteredClient(mqtt.Client):
+    """
+    This class is the paho client of the collector. It counts the messages
+    and the bytes of the PUBLISH packets received, so the cost of a $SYS
+    message can be compared between the protocol versions. With MQTT v5 it
+    also resolves the topic aliases set by the broker before the message
+    is dispatched, paho leaves the topic of an aliased message empty. A
+    client started with 3.1.1 can be switched to v5.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.received_messages = 0
+        self.received_bytes = 0
+        self.aliased_messages = 0
+        self._topic_aliases = dict()
+
+    def use_mqtt5(self, properties) -> None:
+        """
+        This function switches the client to MQTT v5 and reconnects, like
+        paho itself does when it falls back to 3.1. Called from the network
+        loop, a failed connect is retried by the loop with v5
+        :param properties: the MQTT v5 connect properties
+        :return: None
+        """
+        self._protocol = mqtt.MQTTv5
+        self._clean_start = True
+        self._connect_properties = properties
+        try:
+            self.reconnect()
+        except OSError:
+            pass
+
+    def _handle_connack(self):
+        # the aliases only live as long as the connection
+        self._topic_aliases.clear()
+        return super()._handle_connack()
+
+    def _handle_publish(self):
+        remaining_length = len(self._in_packet["packet"])
+        self.received_messages += 1
+        self.received_bytes += (
+            1 + _length_size(remaining_length) + remaining_length
+        )
+        return super()._handle_publish()
+
+    def _handle_on_message(self, message):
+        alias = getattr(
+            getattr(message, "properties", None), "TopicAlias", None
+        )
+        if alias is not None:
+            topic = message.topic
+            if topic:
+                self._topic_aliases[alias] = topic
+            else:
+                topic = self._topic_aliases.get(alias)
+                if topic is None:
+                    # an alias the broker never set, nothing to route on
+                    return
+                message.topic = topic.encode("utf-8")
+                self.aliased_messages += 1
+
+        super()._handle_on_message(message)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the registry holding the state of every $SYS metric
+"""
+
+import time
+from array import array
+
+from config.statsd_config import STATSD_PREFIX
+
+
+def parse_float(payload: bytes) -> float:
+    """
+    This function parses a plain numeric $SYS payload
+    :param payload: the message payload
+    :return: the parsed value
+    """
+    return float(payload)
+
+
+def parse_uptime(payload: bytes) -> float:
+    """
+    This function parses the "<n> seconds" uptime payload
+    :param payload: the message payload
+    :return: the uptime in seconds
+    """
+    return float(payload.split(b' ')[0])
+
+
+# topic, metric name and payload parser of every $SYS metric we collect
+SYS_METRICS = (
+    ("$SYS/broker/bytes/received", "bytes_received", parse_float),
+    ("$SYS/broker/bytes/sent", "bytes_sent", parse_float),
+    ("$SYS/broker/clients/connected", "clients_connected", parse_float),
+    ("$SYS/broker/clients/expired", "clients_expired", parse_float),
+    ("$SYS/broker/clients/disconnected", "clients_disconnected", parse_float),
+    ("$SYS/broker/clients/maximum", "clients_maximum", parse_float),
+    ("$SYS/broker/clients/total", "clients_total", parse_float),
+    ("$SYS/broker/heap/current", "heap_current", parse_float),
+    ("$SYS/broker/heap/maximum", "heap_maximum", parse_float),
+    ("$SYS/broker/load/connections/1min", "connections_1min", parse_float),
+    ("$SYS/broker/load/connections/5min", "connections_5min", parse_float),
+    ("$SYS/broker/load/connections/15min", "connections_15min", parse_float),
+    (
+        "$SYS/broker/load/bytes/received/1min", "bytes_received_1min",
+        parse_float
+    ),
+    (
+        "$SYS/broker/load/bytes/received/5min", "bytes_received_5min",
+        parse_float
+    ),
+    (
+        "$SYS/broker/load/bytes/received/15min", "bytes_received_15min",
+        parse_float
+    ),
+    ("$SYS/broker/load/bytes/sent/1min", "bytes_sent_1min", parse_float),
+    ("$SYS/broker/load/bytes/sent/5min", "bytes_sent_5min", parse_float),
+    ("$SYS/broker/load/bytes/sent/15min", "bytes_sent_15min", parse_float),
+    (
+        "$SYS/broker/load/messages/received/1min", "messages_received_1min",
+        parse_float
+    ),
+    (
+        "$SYS/broker/load/messages/received/5min", "messages_received_5min",
+        parse_float
+    ),
+    (
+        "$SYS/broker/load/messages/received/15min", "messages_received_15min",
+        parse_float
+    ),
+    ("$SYS/broker/load/messages/sent/1min", "messages_sent_1min", parse_float),
+    ("$SYS/broker/load/messages/sent/5min", "messages_sent_5min", parse_float),
+    (
+        "$SYS/broker/load/messages/sent/15min", "messages_sent_15min",
+        parse_float
+    ),
+    (
+        "$SYS/broker/load/publish/dropped/1min", "publish_dropped_1min",
+        parse_float
+    ),
+    (
+        "$SYS/broker/load/publish/dropped/5min", "publish_dropped_5min",
+        parse_float
+    ),
+    (
+        "$SYS/broker/load/publish/dropped/15min", "publish_dropped_15min",
+        parse_float
+    ),
+    (
+        "$SYS/broker/load/publish/received/1min", "publish_received_1min",
+        parse_float
+    ),
+    (
+        "$SYS/broker/load/publish/received/5min", "publish_received_5min",
+        parse_float
+    ),
+    (
+        "$SYS/broker/load/publish/received/15min", "publish_received_15min",
+        parse_float
+    ),
+    ("$SYS/broker/load/publish/sent/1min", "publish_sent_1min", parse_float),
+    ("$SYS/broker/load/publish/sent/5min", "publish_sent_5min", parse_float),
+    ("$SYS/broker/load/publish/sent/15min", "publish_sent_15min", parse_float),
+    ("$SYS/broker/load/sockets/1min", "sockets_1min", parse_float),
+    ("$SYS/broker/load/sockets/5min", "sockets_5min", parse_float),
+    ("$SYS/broker/load/sockets/15min", "sockets_15min", parse_float),
+    ("$SYS/broker/messages/inflight", "inflight", parse_float),
+    ("$SYS/broker/messages/received", "messages_received", parse_float),
+    ("$SYS/broker/messages/sent", "messages_sent", parse_float),
+    ("$SYS/broker/messages/stored", "messages_stored", parse_float),
+    ("$SYS/broker/publish/messages/dropped", "publish_dropped", parse_float),
+    ("$SYS/broker/publish/messages/received", "publish_received", parse_float),
+    ("$SYS/broker/publish/messages/sent", "publish_sent", parse_float),
+    (
+        "$SYS/broker/retained messages/count", "retain_messages_count",
+        parse_float
+    ),
+    ("$SYS/broker/store/messages/count", "store_messages_count", parse_float),
+    ("$SYS/broker/store/messages/bytes", "store_messages_bytes", parse_float),
+    ("$SYS/broker/subscriptions/count", "subscription_count", parse_float),
+    ("$SYS/broker/uptime", "broker_uptime", parse_uptime),
+)
+
+
+class MetricDescriptor:
+    """
+    This class describes a single metric, everything in it is computed once
+    at startup
+    """
+    __slots__ = ("metric_id", "topic", "name", "parser")
+
+    def __init__(self, metric_id: int, topic: str, name: str, parser):
+        """
+        :param metric_id: the index of the metric in the registry arrays
+        :param topic: the $SYS topic the metric is read from
+        :param name: the statsd metric name
+        :param parser: the function turning the payload into a float
+        """
+        self.metric_id = metric_id
+        self.topic = topic
+        self.name = name
+        self.parser = parser
+
+
+class MetricRegistry:
+    """
+    This class assigns every metric an integer id and keeps the current and
+    previous value and timestamp of all metrics in contiguous typed arrays,
+    shared by every stage of the collector
+    """
+    def __init__(self, metrics: tuple=SYS_METRICS):
+        """
+        :param metrics: tuple of (topic, metric name, parser)
+        """
+        self.descriptors = tuple(
+            MetricDescriptor(
+                metric_id, topic, "{}.{}".format(STATSD_PREFIX, name), parser
+            )
+            for metric_id, (topic, name, parser) in enumerate(metrics)
+        )
+        self.by_topic = {
+            descriptor.topic: descriptor for descriptor in self.descriptors
+        }
+        self.by_name = {
+            descriptor.name: descriptor for descriptor in self.descriptors
+        }
+
+        size = len(self.descriptors)
+        self.current = array('d', [0.0]) * size
+        self.previous = array('d', [0.0]) * size
+        self.timestamp = array('d', [0.0]) * size
+        self.previous_timestamp = array('d', [0.0]) * size
+        self.updates = array('L', [0]) * size
+
+    def __len__(self) -> int:
+        return len(self.descriptors)
+
+    def update(
+            self, metric_id: int, value: float, timestamp: float=None
+    ) -> None:
+        """
+        This function stores a new value of the metric
+        :param metric_id: the metric id
+        :param value: the new value
+        :param timestamp: the receive time, defaults to now
+        :return: None
+        """
+        if timestamp is None:
+            timestamp = time.time()
+
+        self.previous[metric_id] = self.current[metric_id]
+        self.previous_timestamp[metric_id] = self.timestamp[metric_id]
+        self.current[metric_id] = value
+        self.timestamp[metric_id] = timestamp
+        self.updates[metric_id] += 1
+
+    def delta(self, metric_id: int):
+        """
+        This function returns the change between the last two values
+        :param metric_id: the metric id
+        :return: the change or None if there are less than two values
+        """
+        if self.updates[metric_id] < 2:
+            return None
+
+        return self.current[metric_id] - self.previous[metric_id]
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the statsd sink the collector sends its metrics to
+"""
+
+import logging.config
+import threading
+import time
+
+import structlog
+from statsd import StatsClient, TCPStatsClient
+
+from config import logging_config
+from config.error import ConfigException
+from config.spool_config import (
+    SPOOL_RETRY_INTERVAL, SPOOL_MAX_AGE
+)
+from config.statsd_config import (
+    STATSD_ADDRESS, STATSD_PORT, STATSD_PROTOCOL, STATSD_TCP_TIMEOUT
+)
+from local_mqtt_client.metric_spool import MetricSpool
+
+
+class MetricSink:
+    """
+    This class sends gauges to statsd. Over udp samples are fire and forget,
+    over tcp a broken connection is noticed, samples are kept in a
+    MetricSpool while the sink is down. statsd can not backfill history, so
+    once the sink is back only the latest spooled value of every metric is
+    sent, after the first new batch. The sink can be shared by several
+    threads. A disabled sink drops everything, it is used by a standby
+    collector.
+    """
+    def __init__(
+            self, protocol: str=STATSD_PROTOCOL, host: str=STATSD_ADDRESS,
+            port: int=STATSD_PORT, spool: MetricSpool=None
+    ):
+        """
+        :param protocol: "udp" or "tcp"
+        :param host: the statsd host
+        :param port: the statsd port
+        :param spool: the spool used in tcp mode, created from the config
+        when not provided
+        """
+        logging.config.dictConfig(logging_config.get_logging_conf())
+        self._logger = structlog.getLogger(__name__)
+        self._logger.addHandler(logging.NullHandler())
+
+        self._spool = None
+        if protocol == "udp":
+            self._client = StatsClient(host=host, port=port)
+        elif protocol == "tcp":
+            self._client = TCPStatsClient(
+                host=host, port=port, timeout=STATSD_TCP_TIMEOUT
+            )
+            self._spool = spool if spool is not None else MetricSpool()
+        else:
+            raise ConfigException(
+                "Unknown statsd protocol {}".format(protocol)
+            )
+
+        self.enabled = True
+        self._observers = list()
+
+        self._lock = threading.Lock()
+        self._down = False
+        self._retry_at = 0.0
+
+        # statsd can not take the samples of a previous run as history, they
+        # would be shown as current values
+        if self._spool is not None and len(self._spool) > 0:
+            self._logger.info(
+                "Dropping the spool of the previous run",
+                backlog=len(self._spool)
+            )
+            self._spool.consume(len(self._spool))
+
+    def add_observer(self, observer) -> None:
+        """
+        This function registers a function called with every batch of
+        samples sent
+        :param observer: function called with a list of (metric name, value)
+        :return: None
+        """
+        self._observers.append(observer)
+
+    def gauge(self, metric: str, value: float) -> None:
+        """
+        This function sends a single gauge
+        :param metric: the statsd metric name
+        :param value: the value
+        :return: None
+        """
+        self.gauges(((metric, value),))
+
+    def gauges(self, samples) -> None:
+        """
+        This function sends a batch of gauges
+        :param samples: iterable of (metric name, value)
+        :return: None
+        """
+        if not self.enabled:
+            return
+
+        if self._observers:
+            samples = list(samples)
+            for observer in self._observers:
+                observer(samples)
+
+        with self._lock:
+            if self._spool is None:
+                self._send(samples)
+            else:
+                self._send_or_spool(list(samples))
+
+    def _send_or_spool(self, samples: list) -> None:
+        """
+        This function sends the samples, or spools them while the sink is
+        down. The first batch sent after an outage is followed by the
+        spooled backlog
+        :param samples: list of (metric name, value)
+        :return: None
+        """
+        if self._down and time.monotonic() < self._retry_at:
+            self._spool.extend(samples, time.time())
+            return
+
+        try:
+            self._send(samples)
+        except OSError as e:
+            self._on_sink_down(e)
+            self._spool.extend(samples, time.time())
+            return
+
+        if self._down:
+            self._down = False
+            self._logger.info(
+                "Metric sink is back, replaying spool",
+                backlog=len(self._spool), dropped=self._spool.dropped
+            )
+        if len(self._spool) > 0:
+            self._replay(samples)
+
+    def _send(self, samples) -> None:
+        """
+        This function sends the samples in a single pipeline
+        :param samples: iterable of (metric name, value)
+        :return: None
+        """
+        with self._client.pipeline() as pipe:
+            for metric, value in samples:
+                pipe.gauge(metric, value)
+
+    def _on_sink_down(self, error: Exception) -> None:
+        """
+        This function marks the sink down and schedules the next attempt
+        :param error: the send error
+        :return: None
+        """
+        if not self._down:
+            self._logger.error(
+                "Metric sink is down, spooling samples", error=error
+            )
+        self._down = True
+        self._retry_at = time.monotonic() + SPOOL_RETRY_INTERVAL
+        self._client.close()
+
+    def _replay(self, sent: list) -> None:
+        """
+        This function sends the latest spooled value of every metric not in
+        the batch just sent and empties the spool. statsd gauges carry no
+        timestamp, older values would only overwrite each other on the
+        chart as current values, so the outage itself is not backfilled
+        :param sent: list of (metric name, value) sent after the outage
+        :return: None
+        """
+        oldest = time.time() - SPOOL_MAX_AGE
+        backlog = len(self._spool)
+        latest = dict()
+        for timestamp, metric, value in self._spool.read(backlog):
+            if timestamp >= oldest:
+                latest[metric] = value
+        for metric, value in sent:
+            latest.pop(metric, None)
+
+        try:
+            self._send(latest.items())
+        except OSError as e:
+            self._on_sink_down(e)
+            return
+
+        self._spool.consume(backlog)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the memory mapped spool keeping samples while the
+metric sink is down
+"""
+
+import logging.config
+import mmap
+import os
+import os.path as osp
+import pathlib
+import struct
+
+import structlog
+
+from config import logging_config
+from config.error import ConfigException
+from config.spool_config import SPOOL_PATH, SPOOL_SIZE
+
+_MAGIC = b"MQMSPOOL"
+
+# magic, index of the oldest sample, index after the newest sample and
+# number of samples overwritten because the spool was full
+_HEADER = struct.Struct("<8sQQQ")
+
+# timestamp, value and NUL padded metric name
+_NAME_SIZE = 80
+_RECORD = struct.Struct("<dd{}s".format(_NAME_SIZE))
+
+# rejected metric names remembered so each is only logged once
+_MAX_REJECTED = 1024
+
+
+class MetricSpool:
+    """
+    This class is a bounded ring of timestamped samples kept in a memory
+    mapped file. Records have a fixed size and the read and write indexes
+    only grow, the slot of a record is its index modulo the capacity. A
+    metric name which is not ascii or longer than a record holds is not
+    spooled, its samples are dropped rather than replayed under a cut name.
+    """
+    def __init__(self, path: str=SPOOL_PATH, size: int=SPOOL_SIZE):
+        """
+        :param path: the spool file
+        :param size: the size of the spool file in bytes
+        """
+        logging.config.dictConfig(logging_config.get_logging_conf())
+        self._logger = structlog.getLogger(__name__)
+        self._logger.addHandler(logging.NullHandler())
+
+        self._rejected = set()
+        self._capacity = (size - _HEADER.size) // _RECORD.size
+        if self._capacity <= 0:
+            raise ConfigException(
+                "Spool size {} is too small to hold a sample".format(size)
+            )
+
+        dir_name = osp.dirname(osp.normpath(path))
+        pathlib.Path(dir_name).mkdir(parents=True, exist_ok=True)
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fresh = os.fstat(fd).st_size != size
+            if fresh:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        magic, self._head, self._tail, self.dropped = _HEADER.unpack_from(
+            self._map, 0
+        )
+        if fresh or magic != _MAGIC:
+            self._head = self._tail = self.dropped = 0
+            self._write_header()
+
+    def __len__(self) -> int:
+        return self._tail - self._head
+
+    def _write_header(self) -> None:
+        _HEADER.pack_into(
+            self._map, 0, _MAGIC, self._head, self._tail, self.dropped
+        )
+
+    def _offset(self, index: int) -> int:
+        return _HEADER.size + (index % self._capacity) * _RECORD.size
+
+    def extend(self, samples, timestamp: float) -> None:
+        """
+        This function appends samples, overwriting the oldest ones once the
+        spool is full
+        :param samples: iterable of (metric name, value)
+        :param timestamp: the time the samples were taken
+        :return: None
+        """
+        for metric, value in samples:
+            name = self._encode_name(metric)
+            if name is None:
+                continue
+            _RECORD.pack_into(
+                self._map, self._offset(self._tail), timestamp, value, name
+            )
+            self._tail += 1
+
+        overflow = self._tail - self._head - self._capacity
+        if overflow > 0:
+            self._head += overflow
+            self.dropped += overflow
+
+        self._write_header()
+
+    def _encode_name(self, metric: str):
+        """
+        This function encodes a metric name for a record
+        :param metric: the metric name
+        :return: the encoded name, None if a record can not hold it
+        """
+        try:
+            name = metric.encode("ascii")
+        except UnicodeEncodeError:
+            reason = "not ascii"
+        else:
+            if len(name) <= _NAME_SIZE:
+                return name
+            reason = "longer than {} bytes".format(_NAME_SIZE)
+
+        if (
+                metric not in self._rejected and
+                len(self._rejected) < _MAX_REJECTED
+        ):
+            self._rejected.add(metric)
+            self._logger.warning(
+                "Metric name can not be spooled, its samples are dropped",
+                metric=metric, reason=reason
+            )
+        return None
+
+    def read(self, count: int) -> list:
+        """
+        This function returns the oldest samples without removing them
+        :param count: maximum number of samples to return
+        :return: list of (timestamp, metric name, value)
+        """
+        samples = list()
+        for index in range(self._head, min(self._head + count, self._tail)):
+            timestamp, value, metric = _RECORD.unpack_from(
+                self._map, self._offset(index)
+            )
+            samples.append(
+                (timestamp, metric.rstrip(b"\0").decode("ascii"), value)
+            )
+
+        return samples
+
+    def consume(self, count: int) -> None:
+        """
+        This function removes the oldest samples
+        :param count: number of samples to remove
+        :return: None
+        """
+        self._head = min(self._head + count, self._tail)
+        self._write_header()
+
+    def close(self) -> None:
+        """
+        This function flushes and unmaps the spool file
+        :return: None
+        """
+        self._map.flush()
+        self._map.close()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the parser of mosquitto log lines
+"""
+
+import re
+
+EVENT_CONNECT = "connect"
+EVENT_DISCONNECT = "disconnect"
+EVENT_TIMEOUT = "timeout"
+EVENT_AUTH_FAILURE = "auth_failure"
+
+EVENTS = (EVENT_CONNECT, EVENT_DISCONNECT, EVENT_TIMEOUT, EVENT_AUTH_FAILURE)
+
+# the patterns are tried in order, the first match wins
+_PATTERNS = (
+    (
+        EVENT_AUTH_FAILURE, re.compile(
+            rb"Client (\S+) disconnected, (?:not authori[sz]ed|"
+            rb"bad username or password)|"
+            rb"Connection refused|not authori[sz]ed"
+        )
+    ),
+    (
+        EVENT_CONNECT,
+        re.compile(rb"New client connected from \S+ as (\S+)")
+    ),
+    (
+        EVENT_TIMEOUT,
+        re.compile(rb"Client (\S+) has exceeded timeout")
+    ),
+    (
+        EVENT_DISCONNECT, re.compile(
+            rb"Client (\S+) disconnected|"
+            rb"Socket error on client (\S+), disconnecting"
+        )
+    ),
+)
+
+
+def parse_log_line(line: bytes):
+    """
+    This function extracts the connection event of a mosquitto log line
+    :param line: the log line, with or without the timestamp prefix
+    :return: tuple of (event, client id) or None if the line is not a
+    connection event, the client id is None when the line does not carry it
+    """
+    # most lines are not about connections, skip them without a regex
+    if b"lient" not in line and b"onnection" not in line:
+        return None
+
+    for event, pattern in _PATTERNS:
+        match = pattern.search(line)
+        if match is not None:
+            client_id = next(
+                (group for group in match.groups() if group is not None),
+                None
+            )
+            if client_id is not None:
+                client_id = client_id.rstrip(b".,")
+            return event, client_id
+
+    return None
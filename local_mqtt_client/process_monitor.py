@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the monitor of the broker process resources
+"""
+
+import logging.config
+import os
+import time
+
+import structlog
+
+from config import logging_config
+from config.process_config import BROKER_PROCESS_NAME, BROKER_PID_FILE
+from config.statsd_config import STATSD_PREFIX
+
+_READ_SIZE = 4096
+
+# fields of /proc/<pid>/status sent as gauges, with their multiplier
+_STATUS_FIELDS = {
+    b"VmRSS": ("rss", 1024),
+    b"VmSize": ("vm_size", 1024),
+    b"VmSwap": ("swap", 1024),
+    b"Threads": ("threads", 1),
+    b"voluntary_ctxt_switches": ("voluntary_ctxt_switches", 1),
+    b"nonvoluntary_ctxt_switches": ("nonvoluntary_ctxt_switches", 1),
+}
+
+
+class ProcessMonitor:
+    """
+    This class samples the broker process from /proc. The stat and status
+    files and the fd directory stay open while the process lives and are
+    reread with pread, so a sample costs no open/close syscalls. The fd
+    directory is only readable by root and the broker user, without it the
+    fd and socket counts are not sent.
+    """
+    def __init__(
+            self, process_name: str=BROKER_PROCESS_NAME,
+            pid_file: str=BROKER_PID_FILE
+    ):
+        """
+        :param process_name: the broker process name
+        :param pid_file: the broker pid file, may not exist
+        """
+        logging.config.dictConfig(logging_config.get_logging_conf())
+        self._logger = structlog.getLogger(__name__)
+        self._logger.addHandler(logging.NullHandler())
+
+        self._process_name = process_name.encode()
+        self._pid_file = pid_file
+        self._clock_ticks = os.sysconf("SC_CLK_TCK")
+
+        self.pid = None
+        self._stat_fd = None
+        self._status_fd = None
+        self._fd_dir_fd = None
+        self._fd_limit = None
+        self._cpu_ticks = None
+        self._sampled_at = None
+        self._fd_dir_denied = False
+        self._failed_pid = None
+
+        self._prefix = "{}.process.".format(STATSD_PREFIX)
+
+    def _find_pid(self):
+        """
+        This function finds the broker pid from the pid file or by name
+        :return: the pid or None
+        """
+        try:
+            with open(self._pid_file, "rb") as pid_file:
+                pid = int(pid_file.read().strip())
+            if self._comm(pid) == self._process_name:
+                return pid
+        except (OSError, ValueError):
+            pass
+
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            if self._comm(int(entry)) == self._process_name:
+                return int(entry)
+
+        return None
+
+    @staticmethod
+    def _comm(pid: int):
+        try:
+            with open("/proc/{}/comm".format(pid), "rb") as comm:
+                return comm.read().strip()
+        except OSError:
+            return None
+
+    def _attach(self) -> bool:
+        """
+        This function opens the /proc files of the broker
+        :return: True if the broker was found
+        """
+        pid = self._find_pid()
+        if pid is None:
+            return False
+
+        base = "/proc/{}/".format(pid)
+        self.pid = pid
+        try:
+            self._stat_fd = os.open(
+                base + "stat", os.O_RDONLY | os.O_CLOEXEC
+            )
+            self._status_fd = os.open(
+                base + "status", os.O_RDONLY | os.O_CLOEXEC
+            )
+            try:
+                self._fd_dir_fd = os.open(
+                    base + "fd", os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC
+                )
+            except PermissionError as e:
+                if not self._fd_dir_denied:
+                    self._fd_dir_denied = True
+                    self._logger.warning(
+                        "Broker fd directory not readable, fds and sockets "
+                        "are not monitored", pid=pid, error=e
+                    )
+            self._fd_limit = None
+            with open(base + "limits", "rb") as limits:
+                for line in limits:
+                    if line.startswith(b"Max open files"):
+                        soft_limit = line.split()[3]
+                        if soft_limit.isdigit():
+                            self._fd_limit = float(soft_limit)
+        except OSError as e:
+            # gone or not readable, the fds opened so far are closed
+            self._detach()
+            if pid != self._failed_pid:
+                self._failed_pid = pid
+                self._logger.error(
+                    "Unable to open the broker /proc files", pid=pid, error=e
+                )
+            return False
+
+        self._cpu_ticks = None
+        return True
+
+    def _detach(self) -> None:
+        """
+        This function closes the /proc files of a gone broker
+        :return: None
+        """
+        for fd in (self._stat_fd, self._status_fd, self._fd_dir_fd):
+            if fd is not None:
+                os.close(fd)
+        self.pid = self._stat_fd = self._status_fd = self._fd_dir_fd = None
+
+    def sample(self) -> list:
+        """
+        This function samples the broker process
+        :return: list of (metric name, value), empty if the broker is not
+        running
+        """
+        if self.pid is None and not self._attach():
+            return []
+
+        try:
+            return self._read()
+        except (ProcessLookupError, FileNotFoundError, PermissionError):
+            # the broker went away, find the new one on the next sample
+            self._detach()
+            return []
+
+    def _read(self) -> list:
+        now = time.monotonic()
+        prefix = self._prefix
+        samples = list()
+
+        stat = os.pread(self._stat_fd, _READ_SIZE, 0)
+        if not stat:
+            raise ProcessLookupError(self.pid)
+        # the command name may contain spaces, the fields start after it
+        fields = stat[stat.rindex(b")") + 2:].split()
+        cpu_ticks = int(fields[11]) + int(fields[12])
+        if self._cpu_ticks is not None and now > self._sampled_at:
+            samples.append((
+                prefix + "cpu_percent",
+                100.0 * (cpu_ticks - self._cpu_ticks) / self._clock_ticks /
+                (now - self._sampled_at)
+            ))
+        self._cpu_ticks = cpu_ticks
+        self._sampled_at = now
+
+        status = os.pread(self._status_fd, _READ_SIZE, 0)
+        for line in status.split(b"\n"):
+            key, _, value = line.partition(b":")
+            field = _STATUS_FIELDS.get(key)
+            if field is not None:
+                name, multiplier = field
+                samples.append(
+                    (prefix + name, float(value.split()[0]) * multiplier)
+                )
+
+        if self._fd_dir_fd is None:
+            if self._fd_limit:
+                samples.append((prefix + "fd_limit", self._fd_limit))
+            return samples
+
+        fds = os.listdir(self._fd_dir_fd)
+        sockets = 0
+        for fd in fds:
+            try:
+                if os.readlink(fd, dir_fd=self._fd_dir_fd).startswith(
+                        "socket:"
+                ):
+                    sockets += 1
+            except FileNotFoundError:
+                # closed while we were listing
+                pass
+
+        samples.append((prefix + "fds", len(fds)))
+        samples.append((prefix + "sockets", sockets))
+        if self._fd_limit:
+            samples.append((prefix + "fd_limit", self._fd_limit))
+            samples.append(
+                (prefix + "fd_usage_percent",
+                 100.0 * len(fds) / self._fd_limit)
+            )
+
+        return samples
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the on demand profiler of the running collector
+"""
+
+import collections
+import logging.config
+import os
+import os.path as osp
+import pathlib
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+import structlog
+
+from config import logging_config
+from config.profiling_config import (
+    PROFILE_DURATION, PROFILE_SAMPLE_INTERVAL, PROFILE_DUMP_DIR, PROFILE_TOP
+)
+
+
+class Profiler:
+    """
+    This class times every wrapped message handler and, on demand, runs a
+    profiling session from its own thread: the stack of the thread running
+    the network loop is sampled at a fixed interval, so the whole of
+    loop_forever is covered and not only the callbacks, and the memory
+    allocated during the session is compared with tracemalloc snapshots.
+    The report is written to a file.
+    """
+    def __init__(
+            self, duration: float=PROFILE_DURATION,
+            sample_interval: float=PROFILE_SAMPLE_INTERVAL,
+            dump_dir: str=PROFILE_DUMP_DIR, top: int=PROFILE_TOP
+    ):
+        """
+        :param duration: default seconds a session runs
+        :param sample_interval: seconds between two stack samples
+        :param dump_dir: directory the reports are written to
+        :param top: number of lines kept in every report section
+        """
+        logging.config.dictConfig(logging_config.get_logging_conf())
+        self._logger = structlog.getLogger(__name__)
+        self._logger.addHandler(logging.NullHandler())
+
+        self._duration = duration
+        self._sample_interval = sample_interval
+        self._dump_dir = dump_dir
+        self._top = top
+
+        # handler name to [calls, total seconds, max seconds]
+        self._handlers = dict()
+        # the thread running the handlers, found on the first call
+        self._target = threading.main_thread().ident
+
+        self._lock = threading.Lock()
+        self._session = None
+
+        # set by the signal handler, the watcher thread starts the session
+        self._requested = threading.Event()
+        self._watcher = None
+
+    def wrap(self, name: str, handler, loop: bool=True):
+        """
+        This function returns the handler timed under the given name
+        :param name: the name of the handler in the report
+        :param handler: the handler function
+        :param loop: True if the handler runs in the network loop thread,
+        the thread sampled by the sessions
+        :return: the timed handler
+        """
+        stats = self._handlers.setdefault(name, [0, 0.0, 0.0])
+
+        def timed(*args, **kwargs):
+            if loop:
+                self._target = threading.get_ident()
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+
+        return timed
+
+    def install_signal_handler(self, signum: int=signal.SIGUSR2) -> None:
+        """
+        This function starts a session whenever the signal is received, it
+        must be called from the main thread. The handler runs in the main
+        thread, which may hold the profiler lock, so it only wakes up a
+        watcher thread starting the session
+        :param signum: the signal
+        :return: None
+        """
+        if self._watcher is None:
+            self._watcher = threading.Thread(
+                target=self._watch, name="profiler_signal", daemon=True
+            )
+            self._watcher.start()
+        signal.signal(signum, self._on_signal)
+
+    def _on_signal(self, signum, frame) -> None:
+        self._requested.set()
+
+    def _watch(self) -> None:
+        """
+        This function is the watcher thread loop, it starts a session for
+        every signal received
+        :return: None
+        """
+        while True:
+            self._requested.wait()
+            self._requested.clear()
+            self.start("signal")
+
+    def start(self, reason: str, duration: float=None) -> bool:
+        """
+        This function starts a profiling session in the background
+        :param reason: why the session runs, part of the report file name
+        :param duration: seconds the session runs, the default when None
+        :return: False if a session is already running
+        """
+        with self._lock:
+            if self._session is not None and self._session.is_alive():
+                return False
+            self._session = threading.Thread(
+                target=self._run, name="profiler", daemon=True,
+                args=(reason, duration or self._duration)
+            )
+            self._session.start()
+
+        self._logger.info(
+            "Profiling session started", reason=reason, duration=duration
+        )
+        return True
+
+    def _run(self, reason: str, duration: float) -> None:
+        """
+        This function is the session thread
+        :param reason: why the session runs
+        :param duration: seconds the session runs
+        :return: None
+        """
+        try:
+            self._write_report(reason, *self._profile(duration))
+        except Exception as e:
+            # the profiler must never take the monitor down
+            self._logger.error("Error profiling the collector", error=e)
+
+    def _profile(self, duration: float) -> tuple:
+        """
+        This function samples the loop thread for the given duration
+        :param duration: seconds to sample
+        :return: tuple of (elapsed seconds, sample count, stack counter,
+        handler stats of the session, tracemalloc statistic diff)
+        """
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        handlers_before = {
+            name: tuple(stats) for name, stats in self._handlers.items()
+        }
+
+        stacks = collections.Counter()
+        samples = 0
+        start = time.monotonic()
+        deadline = start + duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                stacks[_stack(frame)] += 1
+                samples += 1
+                # the frame keeps the whole stack alive until released
+                del frame
+            time.sleep(self._sample_interval)
+        elapsed = time.monotonic() - start
+
+        after = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        # leave out the allocations of the session itself
+        ignored = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        )
+        memory = after.filter_traces(ignored).compare_to(
+            before.filter_traces(ignored), "lineno"
+        )
+
+        handlers = list()
+        for name, (calls, total, maximum) in self._handlers.items():
+            calls_before, total_before, _ = handlers_before.get(
+                name, (0, 0.0, 0.0)
+            )
+            handlers.append(
+                (name, calls - calls_before, total - total_before, maximum)
+            )
+
+        return elapsed, samples, stacks, handlers, memory
+
+    def _write_report(
+            self, reason: str, elapsed: float, samples: int, stacks,
+            handlers: list, memory: list
+    ) -> None:
+        """
+        This function writes the session report
+        :param reason: why the session ran
+        :param elapsed: seconds the session ran
+        :param samples: number of stack samples
+        :param stacks: counter of the sampled stacks, outermost frame first
+        :param handlers: list of (name, calls, total, max) of the session
+        :param memory: tracemalloc statistic diff of the session
+        :return: None
+        """
+        own = collections.Counter()
+        cumulative = collections.Counter()
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                cumulative[function] += count
+
+        path = osp.join(
+            self._dump_dir, "mosquito_monitor-profile-{}-{}-{}.txt".format(
+                time.strftime("%Y%m%d-%H%M%S"), os.getpid(), reason
+            )
+        )
+        pathlib.Path(self._dump_dir).mkdir(parents=True, exist_ok=True)
+        top = self._top
+        total = max(samples, 1)
+
+        with open(path, "w") as report:
+            report.write(
+                "reason: {}\nduration: {:.3f}s\nsamples: {}\n\n".format(
+                    reason, elapsed, samples
+                )
+            )
+
+            report.write("handlers (calls, total ms, avg ms, max ms)\n")
+            for name, calls, seconds, maximum in sorted(
+                    handlers, key=lambda handler: handler[2], reverse=True
+            ):
+                report.write(
+                    "{:>10} {:>12.3f} {:>10.4f} {:>10.3f}  {}\n".format(
+                        calls, seconds * 1000.0,
+                        seconds * 1000.0 / calls if calls else 0.0,
+                        maximum * 1000.0, name
+                    )
+                )
+
+            report.write("\nsampled functions (own %, cumulative %)\n")
+            for function, count in own.most_common(top):
+                report.write("{:>7.2f} {:>7.2f}  {}\n".format(
+                    100.0 * count / total,
+                    100.0 * cumulative[function] / total, function
+                ))
+
+            report.write("\nsampled functions by cumulative %\n")
+            for function, count in cumulative.most_common(top):
+                report.write("{:>7.2f}  {}\n".format(
+                    100.0 * count / total, function
+                ))
+
+            report.write("\nmemory allocated during the session\n")
+            for statistic in memory[:top]:
+                report.write("{}\n".format(statistic))
+
+            # collapsed stacks, the input format of flamegraph.pl
+            report.write("\nstacks\n")
+            for stack, count in stacks.most_common():
+                report.write("{} {}\n".format(";".join(stack), count))
+
+        self._logger.info(
+            "Profiling report written", path=path, reason=reason,
+            samples=samples
+        )
+
+
+def _stack(frame) -> tuple:
+    """
+    This function returns the functions of a stack
+    :param frame: the innermost frame
+    :return: tuple of function names, outermost first
+    """
+    functions = list()
+    while frame is not None:
+        code = frame.f_code
+        functions.append("{} ({}:{})".format(
+            code.co_name, osp.basename(code.co_filename),
+            code.co_firstlineno
+        ))
+        frame = frame.f_back
+    functions.reverse()
+    return tuple(functions)
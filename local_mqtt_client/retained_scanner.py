@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the periodic scanner of the retained messages
+"""
+
+import bisect
+import heapq
+import logging.config
+import os
+import re
+import socket
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+import structlog
+
+from config import logging_config
+from config.retained_config import (
+    RETAINED_SCAN_TOPIC, RETAINED_COUNT_TOPIC, RETAINED_SCAN_INTERVAL,
+    RETAINED_SCAN_RATE, RETAINED_SCAN_QUIET, RETAINED_SCAN_TIMEOUT, RETAINED_TOP_TOPICS,
+    RETAINED_MAX_PREFIXES, RETAINED_SIZE_BUCKETS
+)
+from config.service_name import MICROSERVICE_NAME
+from config.statsd_config import STATSD_PREFIX
+from local_mqtt_client.connection import connect_client
+
+_OTHER_PREFIX = "_other"
+
+# characters allowed in a statsd metric name part
+_METRIC_UNSAFE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+class RetainedInventory:
+    """
+    This class computes the statistics of a stream of retained messages in
+    bounded memory: a payload size histogram, the bytes per top level topic
+    prefix and the largest topics, kept in a min heap of fixed size. The
+    payloads themselves are never stored.
+    """
+    def __init__(
+            self, top_topics: int=RETAINED_TOP_TOPICS,
+            max_prefixes: int=RETAINED_MAX_PREFIXES,
+            buckets: tuple=RETAINED_SIZE_BUCKETS
+    ):
+        """
+        :param top_topics: number of largest topics kept
+        :param max_prefixes: number of prefixes with their own total
+        :param buckets: upper bounds of the size histogram buckets
+        """
+        self._top_topics = top_topics
+        self._max_prefixes = max_prefixes
+        self._buckets = tuple(buckets)
+
+        self.messages = 0
+        self.bytes = 0
+        self._histogram = [0] * (len(self._buckets) + 1)
+        self._prefixes = dict()
+        self._largest = list()
+
+    def add(self, topic: str, size: int) -> None:
+        """
+        This function counts one retained message
+        :param topic: the message topic
+        :param size: the payload size in bytes
+        :return: None
+        """
+        self.messages += 1
+        self.bytes += size
+        self._histogram[bisect.bisect_left(self._buckets, size)] += 1
+
+        prefix = topic.split("/", 1)[0]
+        if (
+                prefix not in self._prefixes and
+                len(self._prefixes) >= self._max_prefixes
+        ):
+            prefix = _OTHER_PREFIX
+        self._prefixes[prefix] = self._prefixes.get(prefix, 0) + size
+
+        if len(self._largest) < self._top_topics:
+            heapq.heappush(self._largest, (size, topic))
+        elif size > self._largest[0][0]:
+            heapq.heapreplace(self._largest, (size, topic))
+
+    def largest(self) -> list:
+        """
+        This function returns the largest topics
+        :return: list of (topic, size), largest first
+        """
+        ranked = sorted(self._largest, reverse=True)
+        return [(topic, size) for size, topic in ranked]
+
+    def samples(self) -> list:
+        """
+        This function returns the statistics as metrics
+        :return: list of (metric name, value)
+        """
+        prefix = "{}.retained.".format(STATSD_PREFIX)
+        samples = [
+            (prefix + "messages", self.messages),
+            (prefix + "bytes", self.bytes),
+            (prefix + "largest",
+             max(self._largest)[0] if self._largest else 0),
+        ]
+
+        for rank, (size, topic) in enumerate(
+                sorted(self._largest, reverse=True), 1
+        ):
+            samples.append((prefix + "top.{}".format(rank), size))
+
+        for bound, count in zip(
+                self._buckets + ("inf",), self._histogram
+        ):
+            samples.append((prefix + "size.le_{}".format(bound), count))
+
+        for topic_prefix, size in self._prefixes.items():
+            name = _METRIC_UNSAFE.sub("_", topic_prefix) or "_empty"
+            samples.append((prefix + "prefix.{}.bytes".format(name), size))
+
+        return samples
+
+
+class RetainedScanner:
+    """
+    This class periodically opens a second connection subscribing to the
+    retained topic wildcard and streams the retained messages the broker
+    sends back through a RetainedInventory. The subscription is qos 1 and
+    the messages are read at a limited rate, as paho only acknowledges a
+    message once its callback returns, the broker sends no faster than the
+    scan reads. The scan ends once the retained messages stop coming.
+    Under this backpressure the broker may drop the retained messages it
+    can not queue, so a scan of "#" also reads the retained $SYS messages,
+    $SYS/# is not matched by "#", and compares the total with the broker
+    count of retained messages.
+    """
+    def __init__(
+            self, sink, username: str=None, password: str=None,
+            tls_context=None, topic: str=RETAINED_SCAN_TOPIC,
+            interval: float=RETAINED_SCAN_INTERVAL,
+            rate: float=RETAINED_SCAN_RATE,
+            quiet: float=RETAINED_SCAN_QUIET,
+            timeout: float=RETAINED_SCAN_TIMEOUT
+    ):
+        """
+        :param sink: the metric sink the statistics are sent to
+        :param username: the broker username
+        :param password: the broker password
+        :param tls_context: the tls context, None for plain tcp
+        :param topic: the wildcard subscribed to
+        :param interval: seconds between two scans
+        :param rate: retained messages read per second
+        :param quiet: seconds without retained message ending the scan
+        :param timeout: seconds after which the scan is cut
+        """
+        logging.config.dictConfig(logging_config.get_logging_conf())
+        self._logger = structlog.getLogger(__name__)
+        self._logger.addHandler(logging.NullHandler())
+
+        self._sink = sink
+        self._username = username
+        self._password = password
+        self._tls_context = tls_context
+        self._topic = topic
+        self._interval = interval
+        self._rate = rate
+        self._quiet = quiet
+        self._timeout = timeout
+
+        self._client_id = "{}-retained-{}-{}".format(
+            MICROSERVICE_NAME.lower(), socket.gethostname(), os.getpid()
+        )
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="retained_scanner", daemon=True
+        )
+
+    def start(self) -> None:
+        """
+        This function starts the scanner thread
+        :return: None
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        This function stops the scanner thread
+        :return: None
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        """
+        This function is the scanner thread loop
+        :return: None
+        """
+        while not self._stop.is_set():
+            try:
+                self.scan()
+            except Exception as e:
+                self._logger.error("Error scanning retained messages", error=e)
+            self._stop.wait(self._interval)
+
+    def scan(self) -> RetainedInventory:
+        """
+        This function runs one scan and sends its statistics
+        :return: the inventory of the scan, None if the broker could not be
+        reached or the scanner was stopped
+        """
+        inventory = RetainedInventory()
+        subscribed = threading.Event()
+        # the receive time of the last retained message, written by the
+        # network loop of the scan connection
+        state = {"last": None, "pace_at": None, "expected": None, "sys": 0}
+        # the broker count covers every retained message, it can only be
+        # compared with a scan of every topic
+        count_retained = self._topic == "#"
+        topics = [(self._topic, 1)]
+        if count_retained:
+            topics.append(("$SYS/#", 1))
+
+        def on_connect(client, userdata, flags, rc):
+            if rc == 0:
+                client.subscribe(topics)
+
+        def on_subscribe(client, userdata, mid, granted_qos):
+            state["last"] = time.monotonic()
+            subscribed.set()
+
+        def on_message(client, userdata, msg):
+            if self._stop.is_set():
+                return
+            is_sys = msg.topic.startswith("$SYS/")
+            if is_sys and msg.topic == RETAINED_COUNT_TOPIC:
+                try:
+                    state["expected"] = int(float(msg.payload))
+                except ValueError:
+                    pass
+            if not msg.retain:
+                # a live publish, not part of the inventory
+                return
+            now = time.monotonic()
+            if is_sys:
+                state["sys"] += 1
+            else:
+                inventory.add(msg.topic, len(msg.payload))
+
+            # pace the reads, the acknowledgement waits for this callback
+            pace_at = state["pace_at"]
+            if pace_at is None:
+                pace_at = now
+            pace_at += 1.0 / self._rate
+            if pace_at > now:
+                self._stop.wait(pace_at - now)
+            state["pace_at"] = max(pace_at, now)
+            state["last"] = time.monotonic()
+
+        client = mqtt.Client(
+            client_id=self._client_id, clean_session=True,
+            protocol=mqtt.MQTTv311
+        )
+        client.on_connect = on_connect
+        client.on_subscribe = on_subscribe
+        client.on_message = on_message
+        if self._username is not None:
+            client.username_pw_set(
+                username=self._username, password=self._password
+            )
+
+        start = time.monotonic()
+        connect_client(client, self._logger, tls_context=self._tls_context)
+        client.loop_start()
+        deadline = start + self._timeout
+        try:
+            # the waits end early when the scanner is stopped
+            while not subscribed.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._logger.error("Retained scan could not subscribe")
+                    return None
+                if self._stop.wait(min(self._quiet / 4, remaining)):
+                    return None
+
+            while not self._stop.is_set():
+                now = time.monotonic()
+                if now >= deadline or now - state["last"] >= self._quiet:
+                    break
+                self._stop.wait(min(self._quiet / 4, deadline - now))
+            timed_out = time.monotonic() >= deadline
+        finally:
+            client.disconnect()
+            client.loop_stop()
+
+        if self._stop.is_set():
+            # a partial scan would be reported as the whole inventory
+            return None
+
+        duration = time.monotonic() - start
+        prefix = "{}.retained.scan.".format(STATSD_PREFIX)
+        samples = inventory.samples()
+        missing = None
+        if state["expected"] is not None:
+            missing = max(
+                state["expected"] - inventory.messages - state["sys"], 0
+            )
+            samples.append((prefix + "missing", missing))
+        truncated = timed_out or bool(missing)
+        samples.append((prefix + "duration", duration))
+        samples.append((prefix + "truncated", int(truncated)))
+        self._sink.gauges(samples)
+
+        self._logger.info(
+            "Retained scan finished", messages=inventory.messages,
+            bytes=inventory.bytes, largest=inventory.largest(),
+            duration=duration, timed_out=timed_out, missing=missing,
+            truncated=truncated
+        )
+        return inventory
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the writer of the shared memory metric table
+"""
+
+import mmap
+import os
+import os.path as osp
+import pathlib
+
+from config.shared_table_config import SHARED_TABLE_PATH
+from local_mqtt_client.shared_table_reader import (
+    MAGIC, LAYOUT_VERSION, HEADER, SEQUENCE_OFFSET, SEQUENCE, NAME, VALUE,
+    table_size
+)
+
+
+class SharedMetricTable:
+    """
+    This class writes the latest value of every registry metric into a
+    memory mapped file of fixed layout, read by SharedTableReader from
+    other processes: a header, the metric names in registry order and one
+    fixed size value slot per metric. Every update is wrapped in a seqlock,
+    the sequence counter is odd while a slot is written. There must be a
+    single writer, the collector updates the table under its state lock.
+    """
+    def __init__(self, names, path: str=SHARED_TABLE_PATH):
+        """
+        :param names: the metric names in metric id order
+        :param path: the table file
+        """
+        names = [name.encode("ascii") for name in names]
+        for name in names:
+            if len(name) > NAME.size:
+                raise ValueError("Metric name {} is too long".format(name))
+
+        self._path = path
+        self._count = len(names)
+        self._values_offset = HEADER.size + self._count * NAME.size
+        self._sequence = 0
+
+        dir_name = osp.dirname(osp.normpath(path))
+        pathlib.Path(dir_name).mkdir(parents=True, exist_ok=True)
+
+        # the table is built aside and renamed in place, a reader never
+        # maps a half written table
+        building = "{}.{}".format(path, os.getpid())
+        size = table_size(self._count)
+        fd = os.open(building, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        for index, name in enumerate(names):
+            NAME.pack_into(self._map, HEADER.size + index * NAME.size, name)
+        HEADER.pack_into(self._map, 0, MAGIC, LAYOUT_VERSION, self._count, 0)
+        os.rename(building, path)
+
+    def update(
+            self, metric_id: int, value: float, timestamp: float,
+            updates: int
+    ) -> None:
+        """
+        This function writes the latest value of a metric
+        :param metric_id: the metric id
+        :param value: the value
+        :param timestamp: the wall clock receive time
+        :param updates: number of updates of the metric
+        :return: None
+        """
+        table = self._map
+        sequence = self._sequence + 1
+        SEQUENCE.pack_into(table, SEQUENCE_OFFSET, sequence)
+        VALUE.pack_into(
+            table, self._values_offset + metric_id * VALUE.size, value,
+            timestamp, updates
+        )
+        self._sequence = sequence + 1
+        SEQUENCE.pack_into(table, SEQUENCE_OFFSET, self._sequence)
+
+    def close(self) -> None:
+        """
+        This function marks the table closed, so the readers map the table
+        of the next collector, and unmaps it
+        :return: None
+        """
+        self._map[:len(MAGIC)] = b"\0" * len(MAGIC)
+        self._map.close()
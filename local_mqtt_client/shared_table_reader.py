@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the reader of the shared memory metric table written
+by the collector. It only uses the standard library so it can be copied
+into the local agents reading the table.
+
+    reader = SharedTableReader("/dev/shm/mosquito_monitor.table")
+    values = reader.snapshot()
+    clients = values["mosquito_monitor.clients_connected"]
+"""
+
+import mmap
+import os
+import struct
+import time
+
+MAGIC = b"MQMTABLE"
+LAYOUT_VERSION = 1
+
+# magic, layout version, number of metrics and sequence counter, the
+# counter is odd while the writer is updating the values
+HEADER = struct.Struct("<8sIIQ")
+SEQUENCE_OFFSET = 16
+SEQUENCE = struct.Struct("<Q")
+
+# NUL padded metric name, the names follow the header
+NAME = struct.Struct("<64s")
+
+# value, wall clock receive time and number of updates, the values follow
+# the names
+VALUE = struct.Struct("<ddQ")
+
+# copies attempted on a busy table before yielding the cpu to the writer
+_SPINS = 100
+
+
+def table_size(count: int) -> int:
+    """
+    This function returns the size of a table
+    :param count: number of metrics
+    :return: the size in bytes
+    """
+    return HEADER.size + count * (NAME.size + VALUE.size)
+
+
+class SharedTableReader:
+    """
+    This class maps the table read only and copies consistent snapshots out
+    of it. The writer increments the sequence counter before and after
+    every update (a seqlock), a copy taken while the counter was odd or
+    changed during the copy is taken again. A read is a few memory copies,
+    no syscall is made unless the writer stays busy for a while, the
+    replacement check is due, or the collector restarted and the table has
+    to be mapped again. A restarted collector renames a new table over the
+    path, the old mapping would keep the last values forever, so the path
+    is checked against the mapped file once per check interval.
+    """
+    def __init__(
+            self, path: str, retries: int=1000, check_interval: float=1.0
+    ):
+        """
+        :param path: the table file
+        :param retries: copies attempted before giving up on a busy table
+        :param check_interval: seconds between two checks of the path
+        """
+        self._path = path
+        self._retries = retries
+        self._check_interval = check_interval
+        self._map = None
+        self._open()
+
+    def _open(self) -> None:
+        """
+        This function maps the table and reads the metric names
+        :return: None
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+        fd = os.open(self._path, os.O_RDONLY)
+        try:
+            stat = os.fstat(fd)
+            self._map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        self._file_id = (stat.st_dev, stat.st_ino)
+        self._check_at = time.monotonic() + self._check_interval
+
+        magic, version, count, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION:
+            raise ValueError("{} is not a metric table".format(self._path))
+
+        self.names = tuple(
+            NAME.unpack_from(self._map, HEADER.size + index * NAME.size)[0]
+            .rstrip(b"\0").decode("ascii")
+            for index in range(count)
+        )
+        self._index = {name: index for index, name in enumerate(self.names)}
+        self._values_offset = HEADER.size + count * NAME.size
+        self._values_end = self._values_offset + count * VALUE.size
+
+    def close(self) -> None:
+        """
+        This function unmaps the table
+        :return: None
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _replaced(self) -> bool:
+        """
+        This function tells if another table was renamed over the path, at
+        most once per check interval
+        :return: True if the path is not the mapped file anymore
+        """
+        now = time.monotonic()
+        if now < self._check_at:
+            return False
+        self._check_at = now + self._check_interval
+
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            # no new table yet, keep the last values
+            return False
+        return (stat.st_dev, stat.st_ino) != self._file_id
+
+    def _copy(self, name: str=None) -> bytes:
+        """
+        This function copies the values consistently
+        :param name: the metric to copy, all of them when None
+        :return: the copied bytes
+        """
+        if self._replaced():
+            self._open()
+
+        for _ in range(2):
+            table = self._map
+            if name is None:
+                start, end = self._values_offset, self._values_end
+            else:
+                start = self._values_offset + self._index[name] * VALUE.size
+                end = start + VALUE.size
+
+            for attempt in range(self._retries):
+                before = SEQUENCE.unpack_from(table, SEQUENCE_OFFSET)[0]
+                if not before & 1:
+                    data = table[start:end]
+                    after = SEQUENCE.unpack_from(table, SEQUENCE_OFFSET)[0]
+                    if after == before:
+                        break
+                if attempt >= _SPINS:
+                    time.sleep(0)
+            else:
+                raise TimeoutError("The metric table stays busy")
+
+            if table[:len(MAGIC)] == MAGIC:
+                return data
+            # the collector closed the table, map the new one
+            self._open()
+
+        raise ValueError("{} is not a metric table".format(self._path))
+
+    def snapshot(self) -> dict:
+        """
+        This function returns every metric of one consistent copy
+        :return: dict of metric name to (value, receive time, updates),
+        the metrics never received have 0 updates
+        """
+        data = self._copy()
+        return {
+            name: VALUE.unpack_from(data, index * VALUE.size)
+            for index, name in enumerate(self.names)
+        }
+
+    def read(self, name: str) -> tuple:
+        """
+        This function returns a single metric
+        :param name: the statsd name of the metric
+        :return: tuple of (value, receive time, updates)
+        """
+        return VALUE.unpack(self._copy(name))
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the per topic staleness detection
+"""
+
+import math
+from array import array
+
+from config.staleness_config import (
+    STALE_TOPICS, STALE_TICK, STALE_WHEEL_SLOTS, STALE_FACTOR, STALE_MIN_AGE,
+    STALE_PERIOD_ALPHA
+)
+from config.statsd_config import STATSD_PREFIX
+
+
+class TimerWheel:
+    """
+    This class is a hashed timer wheel: a deadline is rounded to a tick
+    and stored in the slot of its tick modulo the number of slots, so
+    scheduling is O(1) and a tick only looks at one slot. Rescheduling a
+    key does not search for its previous entry, the entry is dropped when
+    its slot comes round and its tick is not the current deadline of the
+    key anymore.
+    """
+    def __init__(self, tick: float, slots: int, now: float):
+        """
+        :param tick: the resolution of the deadlines in seconds
+        :param slots: number of slots
+        :param now: the current time
+        """
+        self._tick = tick
+        self._slots = [list() for _ in range(slots)]
+        self._current = int(now // tick)
+        self._deadlines = dict()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def schedule(self, key, deadline: float) -> None:
+        """
+        This function sets the deadline of a key, replacing its previous one
+        :param key: the key
+        :param deadline: the time the key expires at
+        :return: None
+        """
+        tick = max(int(math.ceil(deadline / self._tick)), self._current + 1)
+        self._deadlines[key] = tick
+        self._slots[tick % len(self._slots)].append((key, tick))
+
+    def cancel(self, key) -> None:
+        """
+        This function removes the deadline of a key
+        :param key: the key
+        :return: None
+        """
+        self._deadlines.pop(key, None)
+
+    def advance(self, now: float) -> list:
+        """
+        This function moves the wheel to the current time
+        :param now: the current time
+        :return: list of the keys expired since the last call
+        """
+        target = int(now // self._tick)
+        if target <= self._current:
+            return []
+
+        slots = self._slots
+        deadlines = self._deadlines
+        expired = list()
+        # after a full turn every slot was looked at once
+        for step in range(1, min(target - self._current, len(slots)) + 1):
+            index = (self._current + step) % len(slots)
+            slot = slots[index]
+            if not slot:
+                continue
+
+            kept = list()
+            for key, tick in slot:
+                if deadlines.get(key) != tick:
+                    continue
+                if tick <= target:
+                    expired.append(key)
+                    del deadlines[key]
+                else:
+                    kept.append((key, tick))
+            slots[index] = kept
+
+        self._current = target
+        return expired
+
+
+class StalenessTracker:
+    """
+    This class learns the normal update period of the tracked metrics and
+    keeps a deadline per metric in a TimerWheel, a metric not updated by
+    its deadline is stale until its next update. Only metrics published at
+    a fixed interval can be tracked, a metric published on change is
+    silent whenever its value holds. The transitions are sent as a
+    <metric>.stale gauge along with the number of stale metrics.
+    """
+    def __init__(
+            self, registry, now: float, topics: tuple=STALE_TOPICS,
+            tick: float=STALE_TICK, slots: int=STALE_WHEEL_SLOTS,
+            factor: float=STALE_FACTOR, min_age: float=STALE_MIN_AGE,
+            alpha: float=STALE_PERIOD_ALPHA
+    ):
+        """
+        :param registry: the metric registry holding the receive timestamps
+        :param now: the current monotonic time
+        :param topics: the $SYS topics tracked
+        :param tick: the resolution of the deadlines in seconds
+        :param slots: number of slots of the wheel
+        :param factor: update periods without update making a metric stale
+        :param min_age: seconds without update before any metric is stale
+        :param alpha: smoothing factor of the learned period
+        """
+        self._registry = registry
+        self._factor = factor
+        self._min_age = min_age
+        self._alpha = alpha
+
+        self._wheel = TimerWheel(tick, slots, now)
+        self._periods = array('d', [0.0]) * len(registry)
+        self._stale = bytearray(len(registry))
+        self.stale_count = 0
+
+        self._stale_names = tuple(
+            descriptor.name + ".stale" for descriptor in registry.descriptors
+        )
+        self._count_name = "{}.stale_topics".format(STATSD_PREFIX)
+
+        # a tracked metric never received is stale after the minimum age
+        self._tracked = bytearray(len(registry))
+        for topic in topics:
+            descriptor = registry.by_topic.get(topic)
+            if descriptor is not None:
+                self._tracked[descriptor.metric_id] = 1
+                self._wheel.schedule(descriptor.metric_id, now + min_age)
+
+    def update(self, metric_id: int, now: float) -> list:
+        """
+        This function learns from a new sample and moves the deadline of the
+        metric, the registry must already hold the sample
+        :param metric_id: the metric id
+        :param now: the current monotonic time
+        :return: list of (metric name, value), empty unless the metric was
+        stale
+        """
+        if not self._tracked[metric_id]:
+            return []
+
+        registry = self._registry
+        if registry.updates[metric_id] >= 2:
+            interval = (
+                registry.timestamp[metric_id] -
+                registry.previous_timestamp[metric_id]
+            )
+            period = self._periods[metric_id]
+            if period == 0.0:
+                period = interval
+            else:
+                period += self._alpha * (interval - period)
+            self._periods[metric_id] = period
+
+        self._wheel.schedule(
+            metric_id,
+            now + max(self._factor * self._periods[metric_id], self._min_age)
+        )
+
+        if not self._stale[metric_id]:
+            return []
+        self._stale[metric_id] = 0
+        self.stale_count -= 1
+        return [
+            (self._stale_names[metric_id], 0),
+            (self._count_name, self.stale_count),
+        ]
+
+    def advance(self, now: float) -> list:
+        """
+        This function marks the metrics past their deadline stale
+        :param now: the current monotonic time
+        :return: list of (metric name, value) of the new stale metrics
+        """
+        expired = self._wheel.advance(now)
+        if not expired:
+            return []
+
+        samples = list()
+        for metric_id in expired:
+            if not self._stale[metric_id]:
+                self._stale[metric_id] = 1
+                self.stale_count += 1
+                samples.append((self._stale_names[metric_id], 1))
+        samples.append((self._count_name, self.stale_count))
+        return samples
+
+    def stale_names(self) -> list:
+        """
+        This function returns the names of the stale metrics
+        :return: list of metric names
+        """
+        descriptors = self._registry.descriptors
+        return [
+            descriptors[metric_id].name
+            for metric_id, stale in enumerate(self._stale) if stale
+        ]
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the publisher of the collector state back to the broker
+"""
+
+import json
+import socket
+import threading
+import time
+
+from config.error import ConfigException
+from config.republish_config import (
+    REPUBLISH_TOPIC, REPUBLISH_INTERVAL, REPUBLISH_FORMAT, REPUBLISH_QOS
+)
+from config.statsd_config import STATSD_PREFIX
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+def _encode_json(document: dict) -> bytes:
+    return json.dumps(document, separators=(",", ":")).encode("utf-8")
+
+
+def _encode_msgpack(document: dict) -> bytes:
+    return msgpack.packb(document, use_bin_type=True)
+
+
+def _encode_cbor(document: dict) -> bytes:
+    return cbor2.dumps(document)
+
+
+# format name to encoder and the module it needs
+_ENCODERS = {
+    "json": (_encode_json, json),
+    "msgpack": (_encode_msgpack, msgpack),
+    "cbor": (_encode_cbor, cbor2),
+}
+
+
+class StatePublisher:
+    """
+    This class keeps the latest value of every metric sent to the sink and
+    publishes them together as one retained document, so a new subscriber
+    gets the whole state of the collector right away. The document is
+    {"host", "ts", "seq", "metrics": {name: value}}, the metric names
+    without the statsd prefix. Nothing is published while the sink is
+    disabled, a standby must not overwrite the document of the leader.
+    """
+    def __init__(
+            self, client, sink, topic: str=REPUBLISH_TOPIC,
+            interval: float=REPUBLISH_INTERVAL,
+            encoding: str=REPUBLISH_FORMAT, qos: int=REPUBLISH_QOS
+    ):
+        """
+        :param client: the paho client the document is published with
+        :param sink: the metric sink the published values come from
+        :param topic: the retained topic
+        :param interval: seconds between two documents
+        :param encoding: "json", "msgpack" or "cbor"
+        :param qos: the publish qos
+        """
+        encoder = _ENCODERS.get(encoding)
+        if encoder is None:
+            raise ConfigException(
+                "Unknown republish format {}".format(encoding)
+            )
+        if encoder[1] is None:
+            raise ConfigException(
+                "Republish format {} needs a missing package".format(encoding)
+            )
+
+        self._client = client
+        self._sink = sink
+        self._topic = topic
+        self._interval = interval
+        self._encode = encoder[0]
+        self._qos = qos
+
+        self._host = socket.gethostname()
+        self._strip = len(STATSD_PREFIX) + 1
+        self._latest = dict()
+        self._lock = threading.Lock()
+        self._publish_at = time.monotonic() + interval
+        self._seq = 0
+
+    def observe(self, samples) -> None:
+        """
+        This function keeps the latest value of the samples, called by the
+        metric sink with every batch it sends
+        :param samples: list of (metric name, value)
+        :return: None
+        """
+        strip = self._strip
+        with self._lock:
+            for metric, value in samples:
+                self._latest[metric[strip:]] = value
+
+    def on_role_change(self, leader: bool) -> None:
+        """
+        This function forgets the values sent in the previous role, called
+        by the leader election when the collector changes role
+        :param leader: True when the collector leads now
+        :return: None
+        """
+        with self._lock:
+            self._latest.clear()
+
+    def maybe_publish(self, now: float) -> None:
+        """
+        This function publishes the document when the interval is over
+        :param now: the monotonic time
+        :return: None
+        """
+        if now < self._publish_at:
+            return
+        self._publish_at += self._interval * (
+            1 + (now - self._publish_at) // self._interval
+        )
+        self.publish()
+
+    def publish(self) -> None:
+        """
+        This function publishes the document
+        :return: None
+        """
+        if not self._sink.enabled:
+            return
+
+        with self._lock:
+            if not self._latest:
+                return
+            metrics = dict(self._latest)
+
+        self._seq += 1
+        payload = self._encode({
+            "host": self._host,
+            "ts": time.time(),
+            "seq": self._seq,
+            "metrics": metrics,
+        })
+        self._client.publish(
+            self._topic, payload, qos=self._qos, retain=True
+        )
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the $SYS schema profiles of the mosquitto versions
+"""
+
+import re
+
+VERSION_TOPIC = "$SYS/broker/version"
+
+_VERSION_PATTERN = re.compile(rb"mosquitto version (\d+)\.(\d+)(?:\.(\d+))?")
+
+# topics only published by builds with memory tracking, a profile keeps
+# them but they may never come
+_MEMORY_TRACKING_TOPICS = frozenset((
+    "$SYS/broker/heap/current",
+    "$SYS/broker/heap/maximum",
+))
+
+# first version publishing a topic, the topics missing here are published
+# by every version
+_INTRODUCED_IN = {
+    "$SYS/broker/store/messages/count": (1, 5),
+    "$SYS/broker/store/messages/bytes": (1, 5),
+}
+
+
+def parse_version(payload: bytes):
+    """
+    This function parses the $SYS/broker/version payload
+    :param payload: the message payload, "mosquitto version 2.0.18"
+    :return: the version tuple or None for an unknown broker
+    """
+    match = _VERSION_PATTERN.search(payload)
+    if match is None:
+        return None
+    return tuple(int(part or 0) for part in match.groups())
+
+
+class SchemaProfile:
+    """
+    This class is the set of $SYS metrics one broker version publishes,
+    computed once per version from the registry
+    """
+    __slots__ = ("name", "descriptors", "optional", "unsupported")
+
+    def __init__(
+            self, name: str, descriptors: tuple, optional: tuple,
+            unsupported: tuple
+    ):
+        """
+        :param name: the profile name
+        :param descriptors: the descriptors of the metrics subscribed to
+        :param optional: the descriptors depending on build options
+        :param unsupported: the descriptors not published by the version
+        """
+        self.name = name
+        self.descriptors = descriptors
+        self.optional = optional
+        self.unsupported = unsupported
+
+
+class SchemaProfiles:
+    """
+    This class selects the schema profile of a broker version, a profile
+    is built on the first use of its version and reused after that
+    """
+    def __init__(self, registry):
+        """
+        :param registry: the metric registry holding every known metric
+        """
+        self._registry = registry
+        self._profiles = dict()
+
+    def select(self, version) -> SchemaProfile:
+        """
+        This function returns the profile of a broker version
+        :param version: the version tuple, None when it is not known
+        :return: the profile
+        """
+        profile = self._profiles.get(version)
+        if profile is None:
+            profile = self._build(version)
+            self._profiles[version] = profile
+        return profile
+
+    def _build(self, version) -> SchemaProfile:
+        descriptors = list()
+        unsupported = list()
+        for descriptor in self._registry.descriptors:
+            introduced = _INTRODUCED_IN.get(descriptor.topic)
+            if (
+                    version is not None and introduced is not None and
+                    version[:len(introduced)] < introduced
+            ):
+                unsupported.append(descriptor)
+            else:
+                descriptors.append(descriptor)
+
+        name = "all" if version is None else "mosquitto-{}".format(
+            ".".join(str(part) for part in version)
+        )
+        optional = tuple(
+            descriptor for descriptor in descriptors
+            if descriptor.topic in _MEMORY_TRACKING_TOPICS
+        )
+        return SchemaProfile(
+            name, tuple(descriptors), optional, tuple(unsupported)
+        )
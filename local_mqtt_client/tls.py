@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the tls context resuming sessions across reconnects
+"""
+
+import ssl
+import time
+
+from config.mqtt_config import (
+    LOCAL_MQTT_CA_CERTS, LOCAL_MQTT_CERTFILE, LOCAL_MQTT_KEYFILE,
+    LOCAL_MQTT_CIPHERS, LOCAL_MQTT_TLS_INSECURE
+)
+
+
+class _TimedSSLSocket(ssl.SSLSocket):
+    """
+    This class reports the duration of every handshake to its context
+    """
+    def do_handshake(self, block=False):
+        start = time.monotonic()
+        super().do_handshake(block)
+        self.context.handshake_done(self, time.monotonic() - start)
+
+
+class ResumingTLSContext(ssl.SSLContext):
+    """
+    This class is the tls context handed to paho. Every socket it wraps
+    offers the last session received from the broker, so a reconnect does
+    an abbreviated handshake instead of a full one when the broker still
+    knows the session ticket. It also keeps the duration of the last
+    handshake and whether the session was resumed.
+    """
+    sslsocket_class = _TimedSSLSocket
+
+    def __new__(cls, *args, **kwargs):
+        context = super().__new__(cls, ssl.PROTOCOL_TLS_CLIENT)
+        context.session = None
+        context.handshakes = 0
+        context.resumed_handshakes = 0
+        context.last_handshake_duration = None
+        context.last_session_reused = False
+        return context
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        if self.session is not None and "session" not in kwargs:
+            kwargs["session"] = self.session
+        try:
+            return super().wrap_socket(sock, *args, **kwargs)
+        except ValueError:
+            # the session does not match this context or host anymore
+            if kwargs.pop("session", None) is None:
+                raise
+            self.session = None
+            return super().wrap_socket(sock, *args, **kwargs)
+
+    def handshake_done(self, sock, duration: float) -> None:
+        """
+        This function is called by the socket after a handshake
+        :param sock: the tls socket
+        :param duration: the handshake duration in seconds
+        :return: None
+        """
+        self.handshakes += 1
+        self.last_handshake_duration = duration
+        self.last_session_reused = sock.session_reused
+        if sock.session_reused:
+            self.resumed_handshakes += 1
+        self.remember_session(sock)
+
+    def remember_session(self, sock) -> None:
+        """
+        This function keeps the session of the socket for the next connect,
+        with tls 1.3 the ticket only arrives after the handshake so this is
+        called again once the connection is up
+        :param sock: the tls socket
+        :return: None
+        """
+        session = sock.session
+        if session is not None and session.has_ticket:
+            self.session = session
+
+
+def create_tls_context(
+        ca_certs: str=LOCAL_MQTT_CA_CERTS, certfile: str=LOCAL_MQTT_CERTFILE,
+        keyfile: str=LOCAL_MQTT_KEYFILE, ciphers: str=LOCAL_MQTT_CIPHERS,
+        insecure: bool=LOCAL_MQTT_TLS_INSECURE
+) -> ResumingTLSContext:
+    """
+    This function builds the tls context from the config
+    :param ca_certs: ca bundle verifying the broker, None for the system one
+    :param certfile: client certificate
+    :param keyfile: client key
+    :param ciphers: openssl cipher string
+    :param insecure: skip the hostname check
+    :return: the tls context
+    """
+    context = ResumingTLSContext()
+    if ca_certs is not None:
+        context.load_verify_locations(cafile=ca_certs)
+    else:
+        context.load_default_certs()
+
+    if certfile is not None:
+        context.load_cert_chain(certfile, keyfile)
+    if ciphers is not None:
+        context.set_ciphers(ciphers)
+    if insecure:
+        context.check_hostname = False
+
+    return context
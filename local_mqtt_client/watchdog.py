@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the watchdog measuring the health of the collector
+"""
+
+import logging.config
+import os
+import socket
+import threading
+import time
+
+import structlog
+
+from config import logging_config
+from config.health_config import (
+    WATCHDOG_INTERVAL, WATCHDOG_STALL_TIMEOUT, WATCHDOG_EXIT_ON_STALL,
+    WATCHDOG_STALE_AFTER
+)
+from config.service_name import MICROSERVICE_NAME
+
+
+class Watchdog:
+    """
+    This class runs a thread which measures the lag of the paho loop with a
+    probe message published to, and received back from, the broker. It also
+    watches the time spent in the current handler and the age of every $SYS
+    metric, and optionally exits the process when the loop stalls.
+    """
+    def __init__(
+            self, client, registry, interval: float=WATCHDOG_INTERVAL,
+            stall_timeout: float=WATCHDOG_STALL_TIMEOUT,
+            exit_on_stall: bool=WATCHDOG_EXIT_ON_STALL,
+            stale_after: float=WATCHDOG_STALE_AFTER
+    ):
+        """
+        :param client: the paho client
+        :param registry: the metric registry holding the receive timestamps
+        :param interval: seconds between two probes
+        :param stall_timeout: loop lag or handler time considered a stall
+        :param exit_on_stall: exit the process on stall
+        :param stale_after: seconds without $SYS message before the
+        collector is not ready anymore
+        """
+        logging.config.dictConfig(logging_config.get_logging_conf())
+        self._logger = structlog.getLogger(__name__)
+        self._logger.addHandler(logging.NullHandler())
+
+        self._client = client
+        self._registry = registry
+        self._interval = interval
+        self._stall_timeout = stall_timeout
+        self._exit_on_stall = exit_on_stall
+        self._stale_after = stale_after
+
+        self.probe_topic = "{}/watchdog/{}-{}".format(
+            MICROSERVICE_NAME.lower(), socket.gethostname(), os.getpid()
+        )
+        self.connected = False
+        self.handler_errors = 0
+
+        self._probe_sent = None
+        self._loop_lag = 0.0
+        self._busy_since = None
+        self._started = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="watchdog", daemon=True
+        )
+
+        self._client.message_callback_add(self.probe_topic, self._on_probe)
+
+    def start(self) -> None:
+        """
+        This function starts the watchdog thread
+        :return: None
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        This function stops the watchdog thread
+        :return: None
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def on_connect(self) -> None:
+        """
+        This function subscribes to the probe topic, called on connect
+        :return: None
+        """
+        self.connected = True
+        self._client.subscribe(self.probe_topic, qos=0)
+
+    def on_disconnect(self) -> None:
+        """
+        This function forgets the outstanding probe, called on disconnect
+        :return: None
+        """
+        self.connected = False
+        self._probe_sent = None
+
+    def handler_started(self) -> None:
+        """
+        This function is called by the paho thread before running a handler
+        :return: None
+        """
+        self._busy_since = time.monotonic()
+
+    def handler_finished(self, failed: bool=False) -> None:
+        """
+        This function is called by the paho thread after running a handler
+        :param failed: True if the handler raised
+        :return: None
+        """
+        self._busy_since = None
+        if failed:
+            self.handler_errors += 1
+
+    def _on_probe(self, client, userdata, msg) -> None:
+        """
+        This function receives the probe back in the paho thread
+        :param client: the client object
+        :param userdata: the data set by user on startup
+        :param msg: the probe message
+        :return: None
+        """
+        sent = self._probe_sent
+        if sent is not None:
+            self._loop_lag = time.monotonic() - sent
+            self._probe_sent = None
+
+    def loop_lag(self) -> float:
+        """
+        This function returns the loop lag, growing while a probe is
+        outstanding
+        :return: the lag in seconds
+        """
+        sent = self._probe_sent
+        if sent is None:
+            return self._loop_lag
+
+        return max(self._loop_lag, time.monotonic() - sent)
+
+    def handler_time(self) -> float:
+        """
+        This function returns the time spent in the running handler
+        :return: the time in seconds, 0 when no handler runs
+        """
+        busy_since = self._busy_since
+        if busy_since is None:
+            return 0.0
+
+        return time.monotonic() - busy_since
+
+    def topic_ages(self) -> dict:
+        """
+        This function returns the seconds since the last message per topic
+        :return: dict of topic to age, topics never received are left out
+        """
+        now = time.time()
+        registry = self._registry
+        return {
+            descriptor.topic: now - registry.timestamp[descriptor.metric_id]
+            for descriptor in registry.descriptors
+            if registry.updates[descriptor.metric_id] > 0
+        }
+
+    def stalled(self) -> bool:
+        """
+        This function tells if the loop or a handler is stuck
+        :return: True if stalled
+        """
+        return (
+            self.loop_lag() > self._stall_timeout or
+            self.handler_time() > self._stall_timeout
+        )
+
+    def status(self) -> dict:
+        """
+        This function returns the liveness and readiness of the collector
+        :return: the status as a dict
+        """
+        ages = self.topic_ages()
+        last_message_age = min(ages.values()) if ages else None
+        uptime = time.monotonic() - self._started
+
+        live = self._thread.is_alive() and not self.stalled()
+        ready = (
+            live and self.connected and last_message_age is not None and
+            last_message_age < self._stale_after
+        )
+
+        return {
+            "live": live,
+            "ready": ready,
+            "connected": self.connected,
+            "uptime": uptime,
+            "loop_lag": self.loop_lag(),
+            "handler_time": self.handler_time(),
+            "handler_errors": self.handler_errors,
+            "last_message_age": last_message_age,
+            "topic_ages": ages,
+        }
+
+    def _run(self) -> None:
+        """
+        This function is the watchdog thread loop
+        :return: None
+        """
+        while not self._stop.wait(self._interval):
+            if self.stalled():
+                self._logger.error(
+                    "Collector loop stalled", loop_lag=self.loop_lag(),
+                    handler_time=self.handler_time()
+                )
+                if self._exit_on_stall:
+                    # the main thread is blocked in the paho loop, only a
+                    # hard exit brings the process down
+                    os._exit(1)
+
+            if self.connected and self._probe_sent is None:
+                self._probe_sent = time.monotonic()
+                self._client.publish(self.probe_topic, b"", qos=0)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+This file implements the per window min/max/avg aggregation of metrics
+"""
+
+from array import array
+
+
+class WindowAggregator:
+    """
+    This class keeps min, max, sum, last and sample count of every metric for
+    the current window. The values live in preallocated arrays indexed by the
+    registry metric id, so adding a sample does not allocate anything.
+    """
+    def __init__(self, size: int):
+        """
+        :param size: number of metrics in the registry
+        """
+        self._size = size
+
+        self._min = array('d', [0.0]) * size
+        self._max = array('d', [0.0]) * size
+        self._sum = array('d', [0.0]) * size
+        self._last = array('d', [0.0]) * size
+        self._count = array('L', [0]) * size
+
+    def add(self, metric_id: int, value: float) -> None:
+        """
+        This function adds a sample to the current window
+        :param metric_id: the metric id
+        :param value: the sample value
+        :return: None
+        """
+        if self._count[metric_id] == 0:
+            self._min[metric_id] = value
+            self._max[metric_id] = value
+            self._sum[metric_id] = value
+        else:
+            if value < self._min[metric_id]:
+                self._min[metric_id] = value
+            if value > self._max[metric_id]:
+                self._max[metric_id] = value
+            self._sum[metric_id] += value
+
+        self._last[metric_id] = value
+        self._count[metric_id] += 1
+
+    def flush(self) -> list:
+        """
+        This function closes the current window and starts a new one
+        :return: list of (metric id, min, max, mean, last, count) tuples for
+        every metric which got samples in the window
+        """
+        windows = list()
+
+        for metric_id in range(self._size):
+            count = self._count[metric_id]
+            if count == 0:
+                continue
+
+            windows.append((
+                metric_id, self._min[metric_id], self._max[metric_id],
+                self._sum[metric_id] / count, self._last[metric_id], count
+            ))
+            self._count[metric_id] = 0
+
+        return windows
@@ -8,6 +8,7 @@ from __future__ import (
 )
 
 import logging.config
+import signal
 
 import structlog
 
@@ -30,4 +31,14 @@ lbc = LocalMQTTClient()
 
 mosquito_monitor_logger.info("UpstreamMQTTClient Object Created")
 
-lbc.run_loop(in_thread=False, forever=True)
+
+# paho only lets KeyboardInterrupt out of its loop, SIGTERM raises it too so
+# the client is stopped below
+signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+try:
+    lbc.run_loop(in_thread=False, forever=True)
+except KeyboardInterrupt:
+    mosquito_monitor_logger.info("Stopping the Monitor")
+finally:
+    lbc.stop()